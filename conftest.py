@@ -0,0 +1,12 @@
+"""Подмены тестового окружения ``manage.py test`` для запуска через pytest."""
+import pytest
+from core.test_runner import locmem_caches
+from django.test.utils import override_settings
+
+
+@pytest.fixture(autouse=True, scope="session")
+def test_environment(django_test_environment):
+    # Тесты pytest сохраняют картинки во временный MEDIA_ROOT: фоновый
+    # рендер миниатюр пережил бы каталог
+    with locmem_caches(), override_settings(THUMBNAIL_ASYNC=False):
+        yield
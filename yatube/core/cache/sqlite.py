@@ -0,0 +1,295 @@
+"""Кэш в общем SQLite-файле для всех процессов-воркеров узла."""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Кэш не мигрируем: файл со старой схемой просто создаётся заново
+SCHEMA_VERSION = 2
+SCHEMA = (
+    "DROP TABLE IF EXISTS cache",
+    "DROP TABLE IF EXISTS cache_stats",
+    # size стоит до value: подсчёт размеров не читает страницы значений
+    """
+    CREATE TABLE cache (
+        key TEXT PRIMARY KEY,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL,
+        value BLOB NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX cache_accessed ON cache (accessed, size)",
+    "CREATE INDEX cache_expires ON cache (expires)",
+    # Число и размер записей ведут триггеры в той же транзакции, что и
+    # запись, — вытеснению не нужно каждый раз пересчитывать всю таблицу
+    """
+    CREATE TABLE cache_stats (
+        entries INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """,
+    "INSERT INTO cache_stats VALUES (0, 0)",
+    """
+    CREATE TRIGGER cache_inserted AFTER INSERT ON cache BEGIN
+        UPDATE cache_stats SET entries = entries + 1, size = size + NEW.size;
+    END
+    """,
+    """
+    CREATE TRIGGER cache_deleted AFTER DELETE ON cache BEGIN
+        UPDATE cache_stats SET entries = entries - 1, size = size - OLD.size;
+    END
+    """,
+    """
+    CREATE TRIGGER cache_resized AFTER UPDATE OF size ON cache BEGIN
+        UPDATE cache_stats SET size = size + NEW.size - OLD.size;
+    END
+    """,
+    f"PRAGMA user_version = {SCHEMA_VERSION}",
+)
+
+UPSERT = (
+    " ON CONFLICT (key) DO UPDATE SET expires = excluded.expires,"
+    " accessed = excluded.accessed, size = excluded.size,"
+    " value = excluded.value"
+)
+
+# Не чаще раза в секунду переписываем время доступа: чтения почти не пишут
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    """LRU-кэш поверх SQLite в режиме WAL.
+
+    ``LOCATION`` — путь к файлу базы. Помимо стандартных ``MAX_ENTRIES`` и
+    ``CULL_FREQUENCY`` понимает ``MAX_SIZE`` — предел суммарного размера
+    значений в байтах. При превышении любого предела вытесняются давно не
+    читанные записи; ``MAX_ENTRIES = 0`` снимает предел числа записей.
+    Целые числа хранятся как INTEGER, а ``incr`` идёт в транзакции
+    ``BEGIN IMMEDIATE``, так что он атомарен между процессами.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get("OPTIONS", {})
+        self._max_size = options.get("MAX_SIZE")
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(db)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    @staticmethod
+    def _migrate(db):
+        def version():
+            return db.execute("PRAGMA user_version").fetchone()[0]
+
+        if version() == SCHEMA_VERSION:
+            return
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            # Пока ждали блокировку, схему мог обновить другой процесс
+            if version() != SCHEMA_VERSION:
+                for statement in SCHEMA:
+                    db.execute(statement)
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    @staticmethod
+    def _size(value):
+        return 8 if isinstance(value, int) else len(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, rows, timeout, replace=True):
+        """Записывает строки (key, value) и возвращает число вставленных."""
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        verb = "INSERT" if replace else "INSERT OR IGNORE"
+        insert = (
+            f"{verb} INTO cache (key, expires, accessed, size, value) "
+            "VALUES (?, ?, ?, ?, ?)"
+        )
+        if replace:
+            # Не INSERT OR REPLACE: его неявное удаление не вызывает
+            # триггеров, и cache_stats разошлась бы с таблицей
+            insert += UPSERT
+        db = self._db
+        written = 0
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            if not replace:
+                db.executemany(
+                    "DELETE FROM cache WHERE key = ? AND expires <= ?",
+                    ((key, now) for key, _ in rows),
+                )
+            for key, value in rows:
+                encoded = self._encode(value)
+                cursor = db.execute(
+                    insert, (key, expires, now, self._size(encoded), encoded)
+                )
+                written += cursor.rowcount
+            self._cull(db, now)
+        return written
+
+    def _cull(self, db, now):
+        db.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        count, size = db.execute(
+            "SELECT entries, size FROM cache_stats"
+        ).fetchone()
+        if self._max_entries and count > self._max_entries:
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess += self._max_entries // self._cull_frequency
+            db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+        if self._max_size and size > self._max_size:
+            db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(size) OVER (ORDER BY accessed DESC)"
+                "  AS running FROM cache"
+                " ) WHERE running > ?"
+                ")",
+                (self._max_size,),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return bool(self._write([(key, value)], timeout, replace=False))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write([(self._key(key, version), value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        rows = [
+            (self._key(key, version), value) for key, value in data.items()
+        ]
+        if rows:
+            self._write(rows, timeout)
+        return []
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._read([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        found = self._read(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def _read(self, keys):
+        now = time.time()
+        db = self._db
+        placeholders = ", ".join("?" * len(keys))
+        rows = db.execute(
+            "SELECT key, value, accessed FROM cache WHERE key IN "
+            f"({placeholders}) AND (expires IS NULL OR expires > ?)",
+            (*keys, now),
+        ).fetchall()
+        stale = [
+            key
+            for key, _, accessed in rows
+            if accessed < now - ACCESS_RESOLUTION
+        ]
+        if stale:
+            db.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                ((now, key) for key in stale),
+            )
+        return {key: self._decode(value) for key, value, _ in rows}
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._db.execute(
+            "UPDATE cache SET expires = ?, accessed = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            if not isinstance(row[0], int):
+                raise TypeError(f"Value of '{key}' is not an integer")
+            db.execute(
+                "UPDATE cache SET value = value + ?, accessed = ? "
+                "WHERE key = ?",
+                (delta, now, key),
+            )
+        return row[0] + delta
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self._db.execute(
+            "DELETE FROM cache WHERE key = ?", (self._key(key, version),)
+        )
+
+    def delete_many(self, keys, version=None):
+        self._db.executemany(
+            "DELETE FROM cache WHERE key = ?",
+            ((self._key(key, version),) for key in keys),
+        )
+
+    def clear(self):
+        self._db.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Соединение живёт весь процесс: открывать его на каждый запрос
+        # дороже, чем держать.
+        pass
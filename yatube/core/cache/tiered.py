@@ -0,0 +1,118 @@
+"""Двухуровневый кэш: локальный L1 процесса перед общим L2."""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+LOCK_SUFFIX = ":lock"
+
+
+class TieredCache:
+    """Кэш с защитой от «стада» при пересчёте горячих значений.
+
+    В L2 значение хранится вместе со сроком годности и временем, которое
+    ушло на его вычисление. Запись живёт в L2 дольше срока годности
+    (``stale_timeout``), чтобы её можно было отдавать, пока идёт пересчёт.
+
+    * Пересчитывает значение только тот запрос, который первым взял
+      блокировку в L2; остальные отдают устаревшее значение, а если его
+      нет — недолго ждут результата.
+    * Пересчёт начинается вероятностно раньше срока (XFetch): чем дольше
+      считается значение и чем ближе срок, тем выше шанс.
+    """
+
+    def __init__(
+        self,
+        l1_alias="local",
+        l2_alias="default",
+        l1_timeout=5,
+        lock_timeout=10,
+        wait_timeout=1.0,
+        beta=1.0,
+    ):
+        self.l1_alias = l1_alias
+        self.l2_alias = l2_alias
+        self.l1_timeout = l1_timeout
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.beta = beta
+
+    @property
+    def l1(self):
+        return caches[self.l1_alias]
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _is_fresh(self, envelope, now):
+        _, expires, delta = envelope
+        early = -delta * self.beta * math.log(1.0 - random.random())
+        return now + early < expires
+
+    def _store(self, key, value, delta, timeout, stale_timeout):
+        envelope = (value, time.time() + timeout, delta)
+        self.l2.set(key, envelope, timeout + stale_timeout)
+        self.l1.set(key, envelope, min(self.l1_timeout, timeout))
+
+    def _compute(self, key, compute, timeout, stale_timeout, cacheable):
+        started = time.perf_counter()
+        value = compute()
+        delta = time.perf_counter() - started
+        if cacheable is None or cacheable(value):
+            self._store(key, value, delta, timeout, stale_timeout)
+        return value
+
+    def _wait(self, key):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            envelope = self.l2.get(key)
+            if envelope is not None:
+                return envelope
+        return None
+
+    def get_or_set(
+        self, key, compute, timeout, stale_timeout=None, cacheable=None
+    ):
+        """Возвращает значение ``key``, при необходимости вызывая ``compute``.
+
+        ``cacheable`` — необязательный предикат: результаты, для которых он
+        ложен, возвращаются, но не кэшируются.
+        """
+        if stale_timeout is None:
+            stale_timeout = timeout
+        now = time.time()
+        envelope = self.l1.get(key)
+        if envelope is not None and envelope[1] > now:
+            return envelope[0]
+
+        envelope = self.l2.get(key)
+        if envelope is not None and self._is_fresh(envelope, now):
+            l1_timeout = min(self.l1_timeout, envelope[1] - now)
+            self.l1.set(key, envelope, l1_timeout)
+            return envelope[0]
+
+        lock_key = key + LOCK_SUFFIX
+        if self.l2.add(lock_key, 1, self.lock_timeout):
+            try:
+                return self._compute(
+                    key, compute, timeout, stale_timeout, cacheable
+                )
+            finally:
+                self.l2.delete(lock_key)
+
+        if envelope is None:
+            envelope = self._wait(key)
+        if envelope is not None:
+            return envelope[0]
+        return self._compute(key, compute, timeout, stale_timeout, cacheable)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+
+tiered_cache = TieredCache(l1_timeout=settings.TIERED_CACHE_L1_TIMEOUT)
@@ -0,0 +1,54 @@
+import random
+
+from django.conf import settings
+
+from .routers import (
+    is_pinned,
+    pin_to_primary,
+    read_from_replica,
+    request_wrote,
+    start_request,
+)
+
+REPLICA_VIEW_MODULES = ("posts.views",)
+SAFE_METHODS = ("GET", "HEAD")
+
+
+class ReplicaMiddleware:
+    """Отправляет чтения GET-запросов к ``posts.views`` на реплику.
+
+    Реплика выбирается случайно и одна на весь запрос. Пользователь,
+    который недавно писал, читает с основной БД. Ставится после
+    ``AuthenticationMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_request()
+        try:
+            response = self.get_response(request)
+            if settings.DATABASE_REPLICAS and (
+                request_wrote() or request.method not in SAFE_METHODS
+            ):
+                # Лайки пишутся мимо ORM, поэтому закрепляем после любого
+                # изменяющего запроса, а не только после записи через роутер
+                if request.user.is_authenticated:
+                    pin_to_primary(request.user.pk)
+        finally:
+            start_request()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = settings.DATABASE_REPLICAS
+        if (
+            not replicas
+            or request.method not in SAFE_METHODS
+            or view_func.__module__ not in REPLICA_VIEW_MODULES
+        ):
+            return None
+        if request.user.is_authenticated and is_pinned(request.user.pk):
+            return None
+        read_from_replica(random.choice(replicas))
+        return None
@@ -0,0 +1,58 @@
+"""Имитация реплик на SQLite-файлах для локальной разработки."""
+import sqlite3
+import time
+from collections import deque
+
+
+def snapshot(path):
+    """Копия SQLite-базы в памяти на текущий момент."""
+    source = sqlite3.connect(path)
+    copy = sqlite3.connect(":memory:")
+    try:
+        source.backup(copy)
+    finally:
+        source.close()
+    return copy
+
+
+def restore(copy, path):
+    """Заменяет содержимое базы ``path`` снимком ``copy``."""
+    target = sqlite3.connect(path)
+    try:
+        copy.backup(target)
+    finally:
+        target.close()
+
+
+class LaggingReplicator:
+    """Накатывает на реплики снимки основной базы с отставанием.
+
+    Каждый ``tick`` снимает основную базу и копирует в реплики самый
+    свежий снимок старше ``lag`` секунд, так что реплики отстают на
+    ``lag`` плюс интервал между вызовами.
+    """
+
+    def __init__(self, primary, replicas, lag, clock=time.monotonic):
+        self.primary = primary
+        self.replicas = replicas
+        self.lag = lag
+        self.clock = clock
+        self.pending = deque()
+
+    def tick(self):
+        """Возвращает True, если реплики обновились."""
+        now = self.clock()
+        self.pending.append((now, snapshot(self.primary)))
+        ready = None
+        while self.pending and now - self.pending[0][0] >= self.lag:
+            if ready is not None:
+                ready.close()
+            ready = self.pending.popleft()[1]
+        if ready is None:
+            return False
+        try:
+            for path in self.replicas:
+                restore(ready, path)
+        finally:
+            ready.close()
+        return True
@@ -0,0 +1,82 @@
+"""Чтение с реплик и запись в основную БД.
+
+Реплики включает ``ReplicaMiddleware`` на время запроса: до этого и вне
+запросов (команды, фоновые задачи) всё идёт в основную БД. Запись в
+середине запроса возвращает его дочитывание на основную БД, а после
+запроса пользователь ``REPLICA_PIN_SECONDS`` секунд читает только с неё,
+чтобы видеть собственные изменения.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = "db:pinned:{}"
+# Хранилище sorl кэширует и промахи: прочитанное с отстающей реплики
+# «миниатюры нет» заставило бы рендерить её заново
+PRIMARY_ONLY_APPS = {"thumbnail"}
+
+_state = threading.local()
+
+
+def start_request():
+    _state.replica = None
+    _state.replica_read = False
+    _state.wrote = False
+
+
+def read_from_replica(alias):
+    """До конца запроса чтения идут на реплику ``alias``."""
+    _state.replica = alias
+
+
+def request_wrote():
+    return getattr(_state, "wrote", False)
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def request_read_replica():
+    """Читал ли текущий запрос с реплики."""
+    return getattr(_state, "replica_read", False)
+
+
+def _note_write():
+    _state.wrote = True
+    _state.replica = None
+
+
+class ReplicaRouter:
+    """Роутер для ``DATABASE_REPLICAS`` — копий основной БД."""
+
+    def db_for_read(self, model, **hints):
+        alias = getattr(_state, "replica", None)
+        if alias is None or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        _state.replica_read = True
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if settings.DATABASE_REPLICAS:
+            _note_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
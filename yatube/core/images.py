@@ -0,0 +1,86 @@
+"""Обработка загружаемых картинок до сохранения в хранилище."""
+import math
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# Форматы, которые имеет смысл пережимать; GIF может быть анимацией
+OPTIMIZED_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+
+def validate_image_pixels(value):
+    """Не даёт загрузить «бомбу» — картинку с огромным числом пикселей.
+
+    Размеры читаются из заголовка, картинка при этом не декодируется.
+    Уже сохранённые файлы не проверяются.
+    """
+    if getattr(value, "_committed", True):
+        return
+    file = value.file
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            pixels = image.width * image.height
+    except Image.DecompressionBombError:
+        pixels = None
+    except (OSError, SyntaxError):
+        # Битые файлы отсеет сам ImageField
+        return
+    finally:
+        file.seek(0)
+    limit = settings.IMAGE_UPLOAD_MAX_PIXELS
+    if pixels is None or pixels > limit:
+        raise ValidationError(
+            "Слишком большое изображение: больше %(limit)s Мп",
+            code="too_many_pixels",
+            params={"limit": limit // 10 ** 6},
+        )
+
+
+def optimize_image(file):
+    """Уменьшает, очищает от метаданных и пережимает загруженную картинку.
+
+    Длинная сторона ограничивается ``IMAGE_UPLOAD_MAX_SIDE``, EXIF
+    отбрасывается (поворот из него применяется к пикселям), качество —
+    ``IMAGE_UPLOAD_QUALITY``. Формат сохраняется. Возвращает новый файл
+    или None, если пережимать нечего или результат не меньше исходника.
+    """
+    max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+    file.seek(0)
+    with Image.open(file) as source:
+        format_ = source.format
+        if format_ not in OPTIMIZED_FORMATS:
+            return None
+        metadata = "exif" in source.info
+        resized = max(source.size) > max_side
+        if resized:
+            # JPEG сразу декодируется в уменьшенном масштабе
+            ratio = max_side / max(source.size)
+            source.draft(
+                source.mode,
+                tuple(math.ceil(side * ratio) for side in source.size),
+            )
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+        # PNG и WebP по умолчанию дописывают EXIF из ``info``, а его
+        # копируют и exif_transpose, и thumbnail
+        image.info.clear()
+        options = {"optimize": True, "exif": b""}
+        if format_ in ("JPEG", "WEBP"):
+            options["quality"] = settings.IMAGE_UPLOAD_QUALITY
+        if format_ == "JPEG":
+            options["progressive"] = True
+        if "icc_profile" in source.info:
+            options["icc_profile"] = source.info["icc_profile"]
+        buffer = BytesIO()
+        image.save(buffer, format_, **options)
+    file.seek(0)
+    data = buffer.getvalue()
+    if len(data) >= file.size and not (resized or metadata):
+        return None
+    return SimpleUploadedFile(
+        file.name, data, getattr(file, "content_type", None)
+    )
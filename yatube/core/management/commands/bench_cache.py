@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.cache import _create_cache
+from django.core.management.base import BaseCommand
+
+BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", None),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", "files"),
+    "sqlite": ("core.cache.sqlite.SQLiteCache", "cache.sqlite3"),
+}
+
+
+def worker(backend, location, options, results):
+    cache = _create_cache(
+        backend,
+        LOCATION=location or "",
+        OPTIONS={"MAX_ENTRIES": options["keys"] * 2},
+    )
+    rng = random.Random(os.getpid())
+    value = "x" * options["value_size"]
+    hits = misses = 0
+    started = time.perf_counter()
+    for _ in range(options["ops"]):
+        keys = [f"page:{rng.randrange(options['keys'])}" for _ in range(4)]
+        found = cache.get_many(keys)
+        hits += len(found)
+        missing = {key: value for key in keys if key not in found}
+        misses += len(missing)
+        if missing:
+            cache.set_many(missing)
+        try:
+            cache.incr("generation")
+        except ValueError:
+            cache.add("generation", 0)
+            cache.incr("generation")
+    results.put((hits, misses, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает кэш из нескольких процессов и сравнивает пропускную "
+        "способность и долю попаданий LocMemCache, FileBasedCache и "
+        "SQLiteCache"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--ops", type=int, default=2000)
+        parser.add_argument("--keys", type=int, default=500)
+        parser.add_argument("--value-size", type=int, default=2048)
+        parser.add_argument(
+            "--backend", choices=BACKENDS, action="append", dest="backends"
+        )
+
+    def run_backend(self, backend, location, options):
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=worker, args=(backend, location, options, results)
+            )
+            for _ in range(options["processes"])
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+        hits = sum(hit for hit, _, _ in stats)
+        misses = sum(miss for _, miss, _ in stats)
+        generation = _create_cache(backend, LOCATION=location or "").get(
+            "generation"
+        )
+        return elapsed, hits / (hits + misses), generation
+
+    def handle(self, *args, **options):
+        total_ops = options["processes"] * options["ops"]
+        directory = tempfile.mkdtemp()
+        try:
+            for name in options["backends"] or BACKENDS:
+                backend, location = BACKENDS[name]
+                if location:
+                    location = os.path.join(directory, location)
+                elapsed, hit_ratio, generation = self.run_backend(
+                    backend, location, options
+                )
+                self.stdout.write(
+                    f"{name:>7}: {total_ops / elapsed:9.0f} оп/с, "
+                    f"попаданий {hit_ratio:6.1%}, "
+                    f"счётчик {generation} из {total_ops}"
+                )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
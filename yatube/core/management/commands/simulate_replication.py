@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.db.replication import LaggingReplicator
+
+SQLITE_ENGINE = "django.db.backends.sqlite3"
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную SQLite-базу в реплики из DATABASE_REPLICAS с "
+        "заданным отставанием, пока команду не остановят"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lag", type=float, default=2.0, help="Отставание, секунды"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Как часто снимать основную базу, секунды",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Один раз скопировать без отставания и выйти",
+        )
+
+    def database_path(self, alias):
+        database = settings.DATABASES[alias]
+        if database["ENGINE"] != SQLITE_ENGINE:
+            raise CommandError(f"{alias}: имитация работает только с SQLite")
+        return database["NAME"]
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError(
+                "Реплики не настроены: задайте переменную DATABASE_REPLICAS"
+            )
+        replicator = LaggingReplicator(
+            self.database_path(DEFAULT_DB_ALIAS),
+            [self.database_path(a) for a in settings.DATABASE_REPLICAS],
+            0 if options["once"] else options["lag"],
+        )
+        if options["once"]:
+            replicator.tick()
+            self.stdout.write(self.style.SUCCESS("Реплики обновлены"))
+            return
+        self.stdout.write(
+            f"Реплики {', '.join(settings.DATABASE_REPLICAS)} отстают на "
+            f"{options['lag']} с; Ctrl+C — остановить"
+        )
+        try:
+            while True:
+                replicator.tick()
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("Репликация остановлена"))
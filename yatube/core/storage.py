@@ -0,0 +1,91 @@
+"""Хранилище, которое называет файлы по содержимому."""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# posts/ab/cd/abcd….jpg: два уровня по 256 каталогов
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+DELETING_SUFFIX = ".deleting"
+
+
+def shard_path(directory, filename):
+    """Раскладывает файл по подкаталогам из первых символов его имени."""
+    shards = [
+        filename[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    return os.path.join(directory, *shards, filename)
+
+
+def is_sharded(name):
+    parts = name.split("/")
+    if len(parts) <= SHARD_LEVELS:
+        return False
+    directory = "/".join(parts[:-SHARD_LEVELS - 1])
+    return shard_path(directory, parts[-1]) == name
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла; посчитанный при загрузке берётся готовым."""
+    digest = getattr(content, "sha256", None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются SHA-256 своего содержимого.
+
+    Каталог и расширение берутся из исходного имени, поэтому
+    ``upload_to`` продолжает работать; внутри него файлы раскладываются по
+    подкаталогам из первых символов хэша (``shard_path``). Одинаковые
+    загрузки получают одно имя: второй раз файл не пишется, а значит, и
+    миниатюры у них общие.
+    Удалять такой файл можно, только когда на него никто не ссылается
+    (``delete_unreferenced``).
+    """
+
+    def content_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return shard_path(directory, content_hash(content) + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def delete_unreferenced(self, name, is_referenced):
+        """Удаляет файл, если ``is_referenced()`` ложно до и после переноса.
+
+        Между проверкой ссылок и удалением такая же загрузка может пройти
+        ``exists()`` в ``save`` и сохранить ссылку. Поэтому файл сначала
+        атомарно убирается в сторону, ссылки проверяются ещё раз, и при
+        появившейся ссылке файл возвращается. Ссылку, сохранённую уже после
+        второй проверки, должен подстраховать сам загрузивший: убедиться
+        после коммита, что файл на месте. Возвращает True, если файл удалён.
+        """
+        if is_referenced():
+            return False
+        path = self.path(name)
+        aside = path + DELETING_SUFFIX
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            return False
+        if is_referenced():
+            os.replace(aside, path)
+            return False
+        os.remove(aside)
+        return True
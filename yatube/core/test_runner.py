@@ -0,0 +1,33 @@
+"""Запуск тестов без общего кэша разработчика."""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+LOCMEM_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+
+
+def locmem_caches():
+    """``override_settings``, подменяющий все кэши из ``CACHES``.
+
+    Тесты чистят кэш в ``setUp``; без подмены они стирали бы файл
+    ``cache.sqlite3`` разработчика и оставляли его после себя.
+    """
+    return override_settings(
+        CACHES={
+            alias: {"BACKEND": LOCMEM_BACKEND, "LOCATION": f"test-{alias}"}
+            for alias in settings.CACHES
+        }
+    )
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с LocMemCache вместо всех кэшей из ``CACHES``."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = locmem_caches()
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
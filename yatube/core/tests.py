@@ -0,0 +1,441 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from PIL import Image
+from sorl.thumbnail.base import ThumbnailBackend
+
+from .cache.sqlite import SQLiteCache
+from .cache.tiered import LOCK_SUFFIX, TieredCache
+from .db.middleware import ReplicaMiddleware
+from .db.replication import LaggingReplicator
+from .db.routers import is_pinned, request_read_replica
+from .storage import ContentAddressedStorage, is_sharded, shard_path
+from .thumbnail_engine import Engine
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, "cache.sqlite3")
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        self.cache.set("key", {"value": [1, 2]})
+        self.assertEqual(self.cache.get("key"), {"value": [1, 2]})
+        self.cache.delete("key")
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_add_keeps_existing_value(self):
+        self.assertTrue(self.cache.add("key", "first"))
+        self.assertFalse(self.cache.add("key", "second"))
+        self.assertEqual(self.cache.get("key"), "first")
+
+    def test_expiry(self):
+        self.cache.set("key", "value", timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("key"))
+        self.assertTrue(self.cache.add("key", "new"))
+
+    def test_get_many_set_many(self):
+        self.cache.set_many({"a": 1, "b": "two", "c": None})
+        self.assertEqual(
+            self.cache.get_many(["a", "b", "c", "missing"]),
+            {"a": 1, "b": "two", "c": None},
+        )
+
+    def test_incr(self):
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter", 5), 6)
+        self.assertEqual(self.cache.get("counter"), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_bool_keeps_type(self):
+        self.cache.set("flag", True)
+        self.assertIs(self.cache.get("flag"), True)
+
+    def test_lru_eviction_by_entries(self):
+        cache = SQLiteCache(
+            self.location, {"OPTIONS": {"MAX_ENTRIES": 3, "CULL_FREQUENCY": 0}}
+        )
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+        cache._db.execute("UPDATE cache SET accessed = 0 WHERE key LIKE '%b'")
+        cache.set("d", "d")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(
+            cache.get_many(["a", "c", "d"]), {"a": "a", "c": "c", "d": "d"}
+        )
+
+    def test_zero_max_entries_never_evicts(self):
+        cache = SQLiteCache(self.location, {"OPTIONS": {"MAX_ENTRIES": 0}})
+        cache.set_many({str(i): i for i in range(400)})
+        keys = [str(i) for i in range(400)]
+        self.assertEqual(len(cache.get_many(keys)), 400)
+
+    def test_eviction_by_size(self):
+        cache = SQLiteCache(self.location, {"OPTIONS": {"MAX_SIZE": 4096}})
+        for i in range(10):
+            cache.set(f"key{i}", b"x" * 1024)
+        size = cache._db.execute("SELECT SUM(size) FROM cache").fetchone()[0]
+        self.assertLessEqual(size, 4096)
+        self.assertIsNotNone(cache.get("key9"))
+
+    def test_stats_follow_every_write(self):
+        cache = SQLiteCache(self.location, {"OPTIONS": {"MAX_ENTRIES": 5}})
+        cache.set_many({str(i): "x" * i for i in range(8)})
+        cache.set("1", "longer value")
+        cache.add("2", "ignored")
+        cache.set("counter", 1)
+        cache.incr("counter")
+        cache.delete("3")
+        cache.set("expired", "value", timeout=0.01)
+        time.sleep(0.02)
+        cache.set("last", "value")
+        db = cache._db
+        self.assertEqual(
+            db.execute("SELECT entries, size FROM cache_stats").fetchone(),
+            db.execute("SELECT COUNT(*), SUM(size) FROM cache").fetchone(),
+        )
+        cache.clear()
+        self.assertEqual(
+            db.execute("SELECT entries, size FROM cache_stats").fetchone(),
+            (0, 0),
+        )
+
+    def test_old_schema_is_recreated(self):
+        db = sqlite3.connect(self.location)
+        db.execute(
+            "CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "expires REAL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        db.execute("INSERT INTO cache VALUES ('stale', x'00', NULL, 0, 1)")
+        db.commit()
+        db.close()
+
+        self.cache.set("key", "value")
+
+        self.assertEqual(self.cache.get("key"), "value")
+        self.assertEqual(
+            self.cache._db.execute(
+                "SELECT entries FROM cache_stats"
+            ).fetchone(),
+            (1,),
+        )
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set("counter", 0)
+        processes = [
+            multiprocessing.Process(
+                target=increment, args=(self.location, 50)
+            )
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get("counter"), 200)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "l2",
+        },
+        "local": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "l1",
+        },
+    }
+)
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        caches["local"].clear()
+        self.cache = TieredCache(wait_timeout=0.1)
+        self.compute = mock.Mock(return_value="fresh")
+
+    def test_computes_once(self):
+        for _ in range(3):
+            value = self.cache.get_or_set("key", self.compute, 60)
+        self.assertEqual(value, "fresh")
+        self.compute.assert_called_once()
+
+    def test_l1_serves_without_l2(self):
+        self.cache.get_or_set("key", self.compute, 60)
+        caches["default"].clear()
+        value = self.cache.get_or_set("key", self.compute, 60)
+        self.assertEqual(value, "fresh")
+        self.compute.assert_called_once()
+
+    def test_stale_value_while_other_request_recomputes(self):
+        caches["default"].set("key", ("stale", time.time() - 1, 0.1), 60)
+        caches["default"].add("key" + LOCK_SUFFIX, 1, 60)
+
+        value = self.cache.get_or_set("key", self.compute, 60)
+        self.assertEqual(value, "stale")
+        self.compute.assert_not_called()
+
+    def test_expired_value_is_recomputed_by_lock_owner(self):
+        caches["default"].set("key", ("stale", time.time() - 1, 0.1), 60)
+
+        value = self.cache.get_or_set("key", self.compute, 60)
+        self.assertEqual(value, "fresh")
+        self.assertIsNone(caches["default"].get("key" + LOCK_SUFFIX))
+
+    def test_early_expiration(self):
+        caches["default"].set("key", ("old", time.time() + 1, 1000.0), 60)
+
+        value = self.cache.get_or_set("key", self.compute, 60)
+        self.assertEqual(value, "fresh")
+
+    def test_not_cacheable_result(self):
+        for _ in range(2):
+            self.cache.get_or_set(
+                "key", self.compute, 60, cacheable=lambda value: False
+            )
+        self.assertEqual(self.compute.call_count, 2)
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_name_is_content_hash(self):
+        name = self.storage.save("posts/Meme.JPG", ContentFile(b"meme"))
+        digest = hashlib.sha256(b"meme").hexdigest()
+        self.assertEqual(name, shard_path("posts", f"{digest}.jpg"))
+        self.assertTrue(name.startswith(f"posts/{digest[:2]}/{digest[2:4]}/"))
+
+    def test_identical_uploads_share_file(self):
+        first = self.storage.save("posts/a.png", ContentFile(b"same"))
+        second = self.storage.save("posts/b.png", ContentFile(b"same"))
+        other = self.storage.save("posts/c.png", ContentFile(b"other"))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        files = [
+            name for _, _, names in os.walk(self.directory) for name in names
+        ]
+        self.assertEqual(len(files), 2)
+
+    def test_hash_from_upload_handler_is_used(self):
+        content = ContentFile(b"data")
+        content.sha256 = "0" * 64
+        name = self.storage.save("posts/a.gif", content)
+        self.assertEqual(name, shard_path("posts", f"{'0' * 64}.gif"))
+
+    def test_delete_unreferenced(self):
+        name = self.storage.save("posts/a.gif", ContentFile(b"data"))
+
+        self.assertFalse(self.storage.delete_unreferenced(name, lambda: True))
+        self.assertTrue(self.storage.delete_unreferenced(name, lambda: False))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_delete_keeps_file_referenced_during_check(self):
+        name = self.storage.save("posts/a.gif", ContentFile(b"data"))
+        # такая же загрузка сохранила пост между проверкой и удалением
+        references = iter([False, True])
+
+        deleted = self.storage.delete_unreferenced(
+            name, lambda: next(references)
+        )
+
+        self.assertFalse(deleted)
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), b"data")
+
+    def test_is_sharded(self):
+        self.assertTrue(is_sharded("posts/ab/cd/abcdef.gif"))
+        self.assertFalse(is_sharded("posts/abcdef.gif"))
+        self.assertFalse(is_sharded("posts/cd/ab/abcdef.gif"))
+
+
+class DraftEngineTest(SimpleTestCase):
+    options = dict(
+        ThumbnailBackend.default_options, crop="center", upscale=True
+    )
+
+    def open_jpeg(self, size):
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG")
+        return Image.open(BytesIO(buffer.getvalue()))
+
+    def test_large_jpeg_decoded_at_reduced_scale(self):
+        image = self.open_jpeg((4000, 3000))
+        Engine().draft(image, (960, 450), self.options)
+        self.assertEqual(image.size, (1000, 750))
+
+    def test_thumbnail_has_requested_geometry(self):
+        image = self.open_jpeg((4000, 3000))
+        thumbnail = Engine().create(image, (960, 450), dict(self.options))
+        self.assertEqual(thumbnail.size, (960, 450))
+
+    def test_small_image_is_not_drafted(self):
+        image = self.open_jpeg((640, 480))
+        Engine().draft(image, (960, 450), self.options)
+        self.assertEqual(image.size, (640, 480))
+
+
+def index(request):
+    pass
+
+
+def about(request):
+    pass
+
+
+index.__module__ = "posts.views"
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica"],
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "replicas",
+        },
+    },
+)
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.factory = RequestFactory()
+        self.user = User(pk=1, username="user")
+
+    def route(self, request, view=index, write=False):
+        """Алиас, с которого ``view`` прочитал бы пользователя."""
+        aliases = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            if write:
+                router.db_for_write(User)
+            aliases.append(router.db_for_read(User))
+            self.read_replica = request_read_replica()
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(get_response)
+        middleware(request)
+        return aliases[0]
+
+    def get(self, user=None):
+        request = self.factory.get("/")
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_get_reads_from_replica(self):
+        self.assertEqual(self.route(self.get()), "replica")
+
+    def test_reads_outside_requests_go_to_primary(self):
+        self.route(self.get())
+        self.assertEqual(router.db_for_read(User), "default")
+
+    def test_other_views_read_from_primary(self):
+        self.assertEqual(self.route(self.get(), view=about), "default")
+
+    def test_post_pins_user_to_primary(self):
+        request = self.factory.post("/")
+        request.user = self.user
+
+        self.assertEqual(self.route(request), "default")
+        self.assertTrue(is_pinned(self.user.pk))
+        self.assertEqual(self.route(self.get(self.user)), "default")
+        self.assertEqual(self.route(self.get()), "replica")
+
+    def test_write_during_get_switches_to_primary(self):
+        self.assertEqual(
+            self.route(self.get(self.user), write=True), "default"
+        )
+        self.assertTrue(is_pinned(self.user.pk))
+
+    def test_replica_read_is_noted(self):
+        self.route(self.get())
+        self.assertTrue(self.read_replica)
+
+        self.route(self.get(), view=about)
+        self.assertFalse(self.read_replica)
+
+    def test_write_does_not_touch_cache(self):
+        with mock.patch("core.db.routers.cache") as cache:
+            router.db_for_write(User)
+        cache.set.assert_not_called()
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        request = self.factory.post("/")
+        request.user = self.user
+
+        self.assertEqual(self.route(request), "default")
+        self.assertEqual(self.route(self.get()), "default")
+        self.assertFalse(is_pinned(self.user.pk))
+
+
+class LaggingReplicatorTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, "primary.sqlite3")
+        self.replica = os.path.join(self.directory, "replica.sqlite3")
+        self.now = 0.0
+        self.replicator = LaggingReplicator(
+            self.primary, [self.replica], lag=2, clock=lambda: self.now
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def execute(self, path, sql):
+        db = sqlite3.connect(path)
+        try:
+            with db:
+                return db.execute(sql).fetchall()
+        finally:
+            db.close()
+
+    def test_replica_lags_behind_primary(self):
+        self.execute(self.primary, "CREATE TABLE post (text TEXT)")
+        self.execute(self.primary, "INSERT INTO post VALUES ('first')")
+        self.assertFalse(self.replicator.tick())
+
+        self.now = 1.0
+        self.execute(self.primary, "INSERT INTO post VALUES ('second')")
+        self.assertFalse(self.replicator.tick())
+
+        self.now = 2.0
+        self.assertTrue(self.replicator.tick())
+        self.assertEqual(
+            self.execute(self.replica, "SELECT text FROM post"), [("first",)]
+        )
+
+        self.now = 3.0
+        self.replicator.tick()
+        rows = self.execute(self.replica, "SELECT text FROM post")
+        self.assertEqual(len(rows), 2)
@@ -0,0 +1,50 @@
+"""Движок sorl-thumbnail с декодированием JPEG в уменьшенном масштабе."""
+import math
+
+from PIL import Image
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.engines import pil_engine
+
+
+class Engine(pil_engine.Engine):
+    """Pillow-движок, который не декодирует большие JPEG целиком.
+
+    Перед обработкой ``Image.draft`` просит декодер JPEG сразу отдать
+    картинку в 1/2, 1/4 или 1/8 масштаба, но не меньше нужного размера.
+    Дальнейшее уменьшение идёт через ``reducing_gap``: сначала быстрое
+    ``Image.reduce``, потом честный LANCZOS на небольшой картинке.
+    """
+
+    # Во сколько раз картинка должна остаться больше цели перед LANCZOS
+    reducing_gap = 2.0
+
+    def create(self, image, geometry, options):
+        if not options.get("cropbox") and not options.get("remove_border"):
+            self.draft(image, geometry, options)
+        return super().create(image, geometry, options)
+
+    def draft(self, image, geometry, options):
+        if image.format != "JPEG":
+            return
+        x_image, y_image = map(float, image.size)
+        orientation = options.get(
+            "orientation", settings.THUMBNAIL_ORIENTATION
+        )
+        if orientation and self._flip_dimensions(image):
+            x_image, y_image = y_image, x_image
+        factor = self._calculate_scaling_factor(
+            x_image, y_image, geometry, options
+        )
+        if factor < 1:
+            width, height = image.size
+            image.draft(
+                image.mode,
+                (math.ceil(width * factor), math.ceil(height * factor)),
+            )
+
+    def _scale(self, image, width, height):
+        return image.resize(
+            (width, height),
+            resample=Image.LANCZOS,
+            reducing_gap=self.reducing_gap,
+        )
@@ -0,0 +1,43 @@
+"""Обработчики загрузки, которые считают SHA-256 по мере прихода данных."""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+
+class HashingUploadMixin:
+    """Добавляет загруженному файлу атрибут ``sha256``.
+
+    Хэш обновляется теми кусками, которые обработчик сохранил сам, так что
+    файл не приходится перечитывать после загрузки.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        rest = super().receive_data_chunk(raw_data, start)
+        if rest is None:
+            self.sha256.update(raw_data)
+        return rest
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+    HashingUploadMixin, MemoryFileUploadHandler
+):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(
+    HashingUploadMixin, TemporaryFileUploadHandler
+):
+    pass
@@ -1,9 +1,24 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
+from .catalog import group_catalog
 from .models import Comment, Follow, Group, Post
+from .search import build_match, is_available, matching_ids_sql
+from .utils import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class FastChangeListMixin:
+    """Число запросов списка не зависит от числа строк и размера таблицы.
+
+    Внешние ключи выбираются автодополнением, а не списком всех строк,
+    вместо точного ``COUNT(*)`` используется оценка.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class PostAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = (
         "pk",
         "text",
@@ -12,12 +27,29 @@ class PostAdmin(admin.ModelAdmin):
         "group",
     )
     list_editable = ("group",)
+    list_select_related = ("author", "group")
     search_fields = ("text",)
     list_filter = ("pub_date",)
+    autocomplete_fields = ("author",)
     empty_value_display = "-пусто-"
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == "group":
+            # Иначе каждая строка list_editable читает всю таблицу групп
+            field.choices = group_catalog.choices(field)
+        return field
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по индексу FTS5 вместо ``LIKE '%term%'`` по всей таблице."""
+        match = build_match(search_term)
+        if match is None or not is_available():
+            return super().get_search_results(request, queryset, search_term)
+        ids = RawSQL(*matching_ids_sql(match))
+        return queryset.filter(pk__in=ids), False
+
 
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = (
         "pk",
         "title",
@@ -27,15 +59,19 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ("pk", "text", "created", "author")
+    list_select_related = ("author",)
     search_fields = ("text",)
     list_filter = ("created",)
+    autocomplete_fields = ("post", "author")
     empty_value_display = "-пусто-"
 
 
-class FollowAdmin(admin.ModelAdmin):
-    list_dsplay = ("user", "author")
+class FollowAdmin(FastChangeListMixin, admin.ModelAdmin):
+    list_display = ("user", "author")
+    list_select_related = ("user", "author")
+    autocomplete_fields = ("user", "author")
     empty_value_display = "-пусто-"
 
 
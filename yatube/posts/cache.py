@@ -0,0 +1,119 @@
+import hashlib
+import time
+from functools import wraps
+
+from core.cache.tiered import tiered_cache
+from core.db.routers import request_read_replica
+from django.conf import settings
+from django.core.cache import cache
+
+GLOBAL_SCOPE = "global"
+
+
+def group_scope(slug):
+    return f"group:{slug}"
+
+
+def author_scope(username):
+    return f"author:{username}"
+
+
+def user_scope(user_id):
+    """Состояние, видимое только самому пользователю, например его лайки."""
+    return f"user:{user_id}"
+
+
+def post_scopes(post):
+    scopes = [GLOBAL_SCOPE, author_scope(post.author.username)]
+    if post.group_id:
+        scopes.append(group_scope(post.group.slug))
+    return scopes
+
+
+def _generation_key(scope):
+    return f"generation:{scope}"
+
+
+def get_generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Стартуем со времени, чтобы вытесненный счётчик не совпал со
+            # старым значением и не оживил устаревшие страницы.
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _bumped_key(scope):
+    return f"generation-bumped:{scope}"
+
+
+def bump_generations(*scopes):
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+    if settings.DATABASE_REPLICAS:
+        cache.set_many(
+            {_bumped_key(scope): 1 for scope in scopes},
+            settings.REPLICA_PIN_SECONDS,
+        )
+
+
+def _recently_bumped(scopes):
+    return bool(cache.get_many([_bumped_key(scope) for scope in scopes]))
+
+
+def _is_cacheable(response, scopes):
+    if response.status_code != 200 or response.cookies:
+        return False
+    # Реплика могла ещё не получить запись, которая сменила поколение
+    # страницы: такой ответ под новым поколением остался бы устаревшим
+    return not (request_read_replica() and _recently_bumped(scopes))
+
+
+def cache_feed(*scope_templates, timeout=None):
+    """Кэширует GET-страницу до смены поколения любого из её разделов.
+
+    Шаблоны разделов форматируются аргументами view, например
+    ``"group:{slug}"``; для вошедшего пользователя добавляется его
+    собственный раздел. Ключ учитывает пользователя и полный путь запроса.
+    Страницы хранятся в ``tiered_cache``, поэтому истёкшую страницу
+    перестраивает один запрос, а остальные получают прежнюю версию.
+    """
+
+    if timeout is None:
+        timeout = settings.FEED_CACHE_TIMEOUT
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            scopes = [scope.format(**kwargs) for scope in scope_templates]
+            variant = request.get_full_path()
+            if request.user.is_authenticated:
+                scopes.append(user_scope(request.user.pk))
+                # В страницу зашит CSRF-токен, а вход заново меняет и его,
+                # и сессию: у новой сессии — своя копия страницы
+                variant += request.session.session_key or ""
+            generations = ".".join(map(str, get_generations(scopes)))
+            path = hashlib.md5(variant.encode()).hexdigest()
+            key = (
+                f"feed:{view.__name__}:{request.user.pk or 0}:"
+                f"{generations}:{path}"
+            )
+            return tiered_cache.get_or_set(
+                key,
+                lambda: view(request, *args, **kwargs),
+                timeout,
+                cacheable=lambda response: _is_cacheable(response, scopes),
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,100 @@
+"""Каталог групп в памяти процесса.
+
+Групп мало и меняются они редко, поэтому каждый процесс держит их копию
+и не ходит за ними в БД: ни за slug, ни за вариантами формы, ни за
+группами карточек ленты. Сохранение или удаление группы сбрасывает копию
+своего процесса сразу, а остальных — через поколение в общем кэше,
+которое проверяется не чаще раза в ``GROUP_CATALOG_CHECK_INTERVAL`` секунд.
+"""
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache import bump_generations, get_generations
+from .models import Group
+
+CATALOG_SCOPE = "catalog:groups"
+
+
+class GroupCatalog:
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._generation = None
+        self._checked = 0.0
+
+    def _load(self):
+        # Перечитываем после смены поколения, а реплика может ещё не
+        # знать об изменении — иначе копия устареет до следующей смены
+        groups = list(Group.objects.using(DEFAULT_DB_ALIAS).order_by("pk"))
+        return (
+            groups,
+            {group.pk: group for group in groups},
+            {group.slug: group for group in groups},
+        )
+
+    def _get_snapshot(self, refresh=False):
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and not refresh
+            and now - self._checked < self.check_interval
+        ):
+            return snapshot
+        (generation,) = get_generations([CATALOG_SCOPE])
+        if snapshot is None or refresh or generation != self._generation:
+            snapshot = self._load()
+            self._snapshot, self._generation = snapshot, generation
+        self._checked = now
+        return snapshot
+
+    def all(self):
+        return self._get_snapshot()[0]
+
+    def get(self, pk):
+        """Группа по id или None.
+
+        Промах перечитывает каталог: группа могла появиться в другом
+        процессе.
+        """
+        group = self._get_snapshot()[1].get(pk)
+        if group is None:
+            group = self._get_snapshot(refresh=True)[1].get(pk)
+        return group
+
+    def get_by_slug(self, slug):
+        """Группа по slug или None.
+
+        Промах каталог не перечитывает, иначе каждый запрос к
+        несуществующему адресу ходил бы в БД.
+        """
+        return self._get_snapshot()[2].get(slug)
+
+    def choices(self, field):
+        """Варианты ``ModelChoiceField`` без запроса к БД."""
+        choices = []
+        if field.empty_label is not None:
+            choices.append(("", field.empty_label))
+        choices.extend(
+            (field.prepare_value(group), field.label_from_instance(group))
+            for group in self.all()
+        )
+        return choices
+
+    def invalidate(self):
+        self._snapshot = None
+        bump_generations(CATALOG_SCOPE)
+
+
+group_catalog = GroupCatalog(settings.GROUP_CATALOG_CHECK_INTERVAL)
+
+
+def attach_groups(posts):
+    """Проставляет постам группы из каталога вместо JOIN с ``posts_group``."""
+    for post in posts:
+        if post.group_id is not None:
+            group = group_catalog.get(post.group_id)
+            if group is not None:
+                post.group = group
@@ -1,10 +1,27 @@
 from django import forms
 from django.utils.translation import gettext_lazy as _
 
+from .catalog import group_catalog
 from .models import Comment, Post
 
 
 class PostForm(forms.ModelForm):
+    def __init__(self, *args, upload=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        group = self.fields["group"]
+        group.choices = group_catalog.choices(group)
+        self._upload_file = None
+        # Картинка, загруженная кусками, проверяется как обычный файл
+        if upload is not None and not self.files.get("image"):
+            self._upload_file = upload.open()
+            self.files = self.files.copy()
+            self.files["image"] = self._upload_file
+
+    def close(self):
+        """Закрывает файл загрузки, который форма открыла сама."""
+        if self._upload_file is not None:
+            self._upload_file.close()
+
     class Meta:
         model = Post
         fields = (
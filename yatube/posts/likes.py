@@ -0,0 +1,220 @@
+"""Лайки: переключение одним запросом и отложенная запись счётчиков.
+
+Строка ``posts_post_likes`` пишется сразу, а изменение ``like_count``
+копится в кэше ``likes`` и переносится в БД пачками. Этот кэш ничего не
+вытесняет: потерянная дельта — потерянные лайки, которые вернёт только
+``check_post_counters --fix``. Посты с изменениями стоят в очереди из
+пронумерованных ячеек: ``tail`` — номер последней занятой, ``head`` —
+последней разобранной.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .cache import bump_generations, post_scopes
+from .catalog import attach_groups
+from .models import Post
+
+DELTA_KEY = "likes:delta:{}"
+QUEUED_KEY = "likes:queued:{}"
+SLOT_KEY = "likes:queue:{}"
+HEAD_KEY = "likes:queue:head"
+TAIL_KEY = "likes:queue:tail"
+FLUSH_DUE_KEY = "likes:flush:due"
+FLUSH_LOCK_KEY = "likes:flush:lock"
+GAP_KEY = "likes:queue:gap"
+FLUSH_LOCK_TIMEOUT = 60
+CACHE_ALIAS = "likes"
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _incr(key, delta=1):
+    cache = _cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+
+
+def set_like(post_id, user_id, liked):
+    """Ставит или снимает лайк одним запросом; True, если что-то изменилось."""
+    ops = connection.ops
+    table = ops.quote_name(Post.likes.through._meta.db_table)
+    if liked:
+        sql = "{} {} (post_id, user_id) VALUES (%s, %s) {}".format(
+            ops.insert_statement(ignore_conflicts=True),
+            table,
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+        )
+    else:
+        # QuerySet.delete() сначала выбрал бы строки для сигналов
+        sql = f"DELETE FROM {table} WHERE post_id = %s AND user_id = %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [post_id, user_id])
+        return cursor.rowcount > 0
+
+
+def toggle_like(post_id, user_id):
+    """Переключает лайк; возвращает ``(новое состояние, изменилось ли)``.
+
+    Если параллельный запрос успел поставить тот же лайк, вставка ничего
+    не меняет и отложенный счётчик трогать не нужно.
+    """
+    if set_like(post_id, user_id, False):
+        return False, True
+    return True, set_like(post_id, user_id, True)
+
+
+def record_like(post_id, liked):
+    """Откладывает изменение ``like_count`` на ±1 до ``flush_like_counts``."""
+    _incr(DELTA_KEY.format(post_id), 1 if liked else -1)
+    # Метка живёт ограниченно: если ячейку очереди вытеснят из кэша,
+    # пост встанет в очередь заново при следующем лайке
+    queued_timeout = settings.LIKE_FLUSH_INTERVAL * 10 or None
+    if _cache().add(QUEUED_KEY.format(post_id), 1, queued_timeout):
+        slot = _incr(TAIL_KEY)
+        _cache().set(SLOT_KEY.format(slot), post_id, None)
+
+
+def pending_like_deltas(post_ids):
+    """Ещё не записанные в БД изменения счётчиков: ``{id поста: дельта}``."""
+    keys = {DELTA_KEY.format(post_id): post_id for post_id in post_ids}
+    return {
+        keys[key]: delta
+        for key, delta in _cache().get_many(list(keys)).items()
+    }
+
+
+def like_count(post):
+    """Число лайков поста с учётом отложенных изменений."""
+    delta = pending_like_deltas([post.pk]).get(post.pk, 0)
+    return max(post.like_count + delta, 0)
+
+
+def attach_likes(posts, user):
+    """Проставляет постам ``like_total`` и ``is_liked`` для ``user``.
+
+    Счётчики с отложенными изменениями читаются из кэша одним запросом,
+    а лайки пользователя на всех постах — одним ``IN``.
+    """
+    posts = list(posts)
+    post_ids = [post.pk for post in posts]
+    deltas = pending_like_deltas(post_ids)
+    liked = set()
+    if user.is_authenticated and post_ids:
+        liked = set(
+            Post.likes.through.objects.filter(
+                user_id=user.pk, post_id__in=post_ids
+            ).values_list("post_id", flat=True)
+        )
+    for post in posts:
+        post.like_total = max(post.like_count + deltas.get(post.pk, 0), 0)
+        post.is_liked = post.pk in liked
+
+
+def _take_deltas(post_ids):
+    deltas = {}
+    for post_id, delta in pending_like_deltas(post_ids).items():
+        if delta:
+            # Вычитаем взятое, а не обнуляем: лайки, пришедшие между
+            # чтением и записью, останутся до следующего сброса
+            _incr(DELTA_KEY.format(post_id), -delta)
+            deltas[post_id] = delta
+    return deltas
+
+
+def _apply_deltas(deltas):
+    by_delta = {}
+    for post_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(post_id)
+    for delta, post_ids in by_delta.items():
+        Post.objects.filter(pk__in=post_ids).update(
+            like_count=Greatest(F("like_count") + delta, 0)
+        )
+    posts = list(
+        Post.objects.filter(pk__in=deltas)
+        .select_related("author")
+        .only("group", "author__username")
+    )
+    attach_groups(posts)
+    for post in posts:
+        bump_generations(*post_scopes(post))
+
+
+def _first_gap(slots, found):
+    """Первая ячейка, в которую ``record_like`` ещё не успел записать пост.
+
+    Если ячейка пуста и при прошлом сбросе, писавший процесс умер между
+    ``incr`` и ``set`` — такую пропускаем.
+    """
+    cache = _cache()
+    for key, slot in slots.items():
+        if key in found:
+            continue
+        if cache.get(GAP_KEY) == slot:
+            continue
+        cache.set(GAP_KEY, slot, None)
+        return slot
+    return None
+
+
+def flush_like_counts(batch_size=None):
+    """Переносит накопленные изменения счётчиков в БД пачками.
+
+    Возвращает число обновлённых постов; одновременно работает только
+    один сброс. На ячейке, которую ещё заполняют, сброс останавливается
+    до следующего раза, чтобы не оставить пост с меткой «в очереди», но
+    вне её.
+    """
+    cache = _cache()
+    if not cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        return 0
+    batch_size = batch_size or settings.LIKE_FLUSH_BATCH
+    flushed = 0
+    try:
+        head = cache.get(HEAD_KEY, 0)
+        tail = cache.get(TAIL_KEY, 0)
+        if head > tail:
+            # Счётчик очереди потерялся вместе с кэшем — начинаем заново
+            head = 0
+        while head < tail:
+            last = min(tail, head + batch_size)
+            slots = {
+                SLOT_KEY.format(slot): slot
+                for slot in range(head + 1, last + 1)
+            }
+            found = cache.get_many(list(slots))
+            gap = _first_gap(slots, found)
+            if gap is not None:
+                last = gap - 1
+                slots = {
+                    key: slot for key, slot in slots.items() if slot <= last
+                }
+            post_ids = {found[key] for key in slots if key in found}
+            cache.delete_many(
+                list(slots)
+                + [QUEUED_KEY.format(post_id) for post_id in post_ids]
+            )
+            deltas = _take_deltas(post_ids)
+            if deltas:
+                _apply_deltas(deltas)
+                flushed += len(deltas)
+            head = last
+            cache.set(HEAD_KEY, head, None)
+            if gap is not None:
+                break
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return flushed
+
+
+def flush_if_due():
+    """Сбрасывает счётчики не чаще раза в ``LIKE_FLUSH_INTERVAL`` секунд."""
+    if _cache().add(FLUSH_DUE_KEY, 1, settings.LIKE_FLUSH_INTERVAL):
+        flush_like_counts()
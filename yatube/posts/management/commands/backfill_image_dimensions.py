@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет image_width и image_height постов, у которых они пусты. "
+        "Каждый файл открывается один раз, даже если он общий у постов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def batches(self, batch_size):
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk, image_width__isnull=True)
+                .exclude(image="")
+                .order_by("pk")
+                .only("pk", "image", "image_width", "image_height")[
+                    :batch_size
+                ]
+            )
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def handle(self, *args, **options):
+        filled = unreadable = 0
+        for batch in self.batches(options["batch_size"]):
+            dimensions = {}
+            for post in batch:
+                name = post.image.name
+                if name not in dimensions:
+                    dimensions[name] = post.read_image_dimensions()
+                post.image_width, post.image_height = dimensions[name]
+                if post.image_width is None:
+                    unreadable += 1
+                    self.stderr.write(f"Пост {post.pk}: не прочитать {name}")
+                else:
+                    filled += 1
+            Post.objects.bulk_update(batch, ["image_width", "image_height"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Заполнено: {filled}, не удалось прочитать: {unreadable}"
+            )
+        )
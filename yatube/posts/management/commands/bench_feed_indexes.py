@@ -0,0 +1,150 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Засевает базу тестовыми данными и сравнивает планы и время "
+        "запросов лент с составными индексами и без них. "
+        "Все изменения откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--authors", type=int, default=200)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--comments", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def seed(self, options):
+        prefix = f"bench{int(time.time())}"
+        User.objects.bulk_create(
+            User(username=f"{prefix}_{i}") for i in range(options["authors"])
+        )
+        authors = list(
+            User.objects.filter(username__startswith=prefix).values_list(
+                "pk", flat=True
+            )
+        )
+        Group.objects.bulk_create(
+            Group(title=f"{prefix}_{i}", slug=f"{prefix}-{i}", description="")
+            for i in range(options["groups"])
+        )
+        groups = list(
+            Group.objects.filter(slug__startswith=prefix).values_list(
+                "pk", flat=True
+            )
+        )
+        Post.objects.bulk_create(
+            (
+                Post(
+                    text=f"text {i}",
+                    author_id=random.choice(authors),
+                    group_id=random.choice(groups),
+                )
+                for i in range(options["posts"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        # auto_now_add проставляет всем одно время, разносим даты по id
+        now = timezone.now()
+        posts = list(
+            Post.objects.filter(author_id__in=authors)
+            .order_by("-pk")
+            .only("pk")
+        )
+        for offset, post in enumerate(posts):
+            post.pub_date = now - timedelta(minutes=offset)
+        Post.objects.bulk_update(posts, ["pub_date"], batch_size=BATCH_SIZE)
+
+        hot_post = posts[0]
+        Comment.objects.bulk_create(
+            (
+                Comment(
+                    post_id=hot_post.pk,
+                    author_id=random.choice(authors),
+                    text="text",
+                )
+                for _ in range(options["comments"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        Follow.objects.bulk_create(
+            Follow(user_id=user_id, author_id=authors[0])
+            for user_id in authors[1:]
+        )
+        return authors[0], groups[0], hot_post.pk
+
+    def workload(self, author_id, group_id, post_id):
+        feed = Post.objects.for_feed().order_by("-pub_date", "-id")
+        pub_date, pk = feed.values_list("pub_date", "id")[5000]
+        return {
+            "index": feed[:11],
+            "index, глубокая страница": feed.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )[:11],
+            "group": feed.filter(group_id=group_id)[:11],
+            "profile": feed.filter(author_id=author_id)[:11],
+            "comments": Comment.objects.filter(post_id=post_id).order_by(
+                "created"
+            ),
+            "followers": Follow.objects.filter(author_id=author_id).values(
+                "user_id"
+            ),
+        }
+
+    def measure(self, queries, repeat, label):
+        results = {}
+        with connection.cursor() as cursor:
+            for name, queryset in queries.items():
+                sql, params = queryset.query.sql_with_params()
+                # метка в тексте не даёт sqlite3 взять план из кэша выражений
+                explain = f"EXPLAIN QUERY PLAN /* {label} */ {sql}"
+                cursor.execute(explain, params)
+                plan = "; ".join(str(row[-1]) for row in cursor.fetchall())
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append(time.perf_counter() - started)
+                results[name] = (plan, min(timings) * 1000)
+        return results
+
+    def drop_indexes(self):
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model in (Post, Comment, Follow):
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write("Засеваем базу...")
+            queries = self.workload(*self.seed(options))
+            after = self.measure(queries, options["repeat"], "after")
+            self.drop_indexes()
+            before = self.measure(queries, options["repeat"], "before")
+            transaction.set_rollback(True)
+
+        for name in queries:
+            plan_before, ms_before = before[name]
+            plan_after, ms_after = after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  без индексов: {ms_before:.2f} мс")
+            self.stdout.write(f"    {plan_before}")
+            self.stdout.write(f"  с индексами:  {ms_after:.2f} мс")
+            self.stdout.write(f"    {plan_after}")
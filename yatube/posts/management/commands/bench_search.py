@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post
+from posts.search import SearchPaginator, build_match
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+WORDS = (
+    "город река утро вечер дорога поезд книга музыка кофе дождь "
+    "снег лето осень зима весна море горы лес поле сад кошка собака "
+    "работа отпуск проект встреча друзья семья праздник фильм"
+).split()
+RARE_WORD = "жирафотерапия"
+
+
+class Command(BaseCommand):
+    help = (
+        "Засевает базу постами и сравнивает поиск через LIKE с поиском по "
+        "индексу FTS5 для частых и редких слов. Все изменения откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--words", type=int, default=40)
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def seed(self, options):
+        author = User.objects.create(username=f"bench{int(time.time())}")
+        rare = set(random.sample(range(options["posts"]), 5))
+        Post.objects.bulk_create(
+            (
+                Post(
+                    text=" ".join(
+                        random.choices(WORDS, k=options["words"])
+                        + ([RARE_WORD] if i in rare else [])
+                    ),
+                    author=author,
+                )
+                for i in range(options["posts"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+    def like(self, term):
+        # Так искала админка: LIKE по всей таблице, первая страница
+        return list(
+            Post.objects.filter(text__icontains=term).order_by("-pk")[:11]
+        )
+
+    def fts(self, term):
+        paginator = SearchPaginator(build_match(term), 10)
+        return list(paginator.get_cursor_page())
+
+    def measure(self, search, term, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            search(term)
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write("Засеваем базу...")
+            self.seed(options)
+            terms = {
+                "частое слово": WORDS[0],
+                "редкое слово": RARE_WORD,
+                "нет совпадений": "квазар",
+            }
+            for name, term in terms.items():
+                like_ms = self.measure(self.like, term, options["repeat"])
+                fts_ms = self.measure(self.fts, term, options["repeat"])
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(f"  LIKE: {like_ms:.2f} мс")
+                self.stdout.write(f"  FTS5: {fts_ms:.2f} мс")
+            transaction.set_rollback(True)
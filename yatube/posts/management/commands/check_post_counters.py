@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.likes import flush_like_counts, pending_like_deltas
+from posts.models import Comment, Post
+
+COUNTERS = (
+    ("like_count", "likes_total"),
+    ("comment_count", "comments_total"),
+)
+
+
+def count_per_post(queryset):
+    """Число строк ``queryset`` у каждого поста — подзапросом.
+
+    Два ``Count`` через JOIN дали бы по строке на каждую пару лайк —
+    комментарий.
+    """
+    return Coalesce(
+        Subquery(
+            queryset.filter(post=OuterRef("pk"))
+            .order_by()
+            .values("post")
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет like_count и comment_count постов с фактическими данными. "
+        "Лайки, ещё не перенесённые из кэша, учитываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Записать фактические значения в рассинхронизированные посты",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def batches(self, batch_size):
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "like_count", "comment_count")
+                .annotate(
+                    likes_total=count_per_post(Post.likes.through.objects),
+                    comments_total=count_per_post(Comment.objects),
+                )[:batch_size]
+            )
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def handle(self, *args, **options):
+        # Отложенные изменения добавятся к like_count при следующем сбросе,
+        # поэтому сверяем и пишем значение без них
+        flush_like_counts()
+        checked = broken = 0
+        for batch in self.batches(options["batch_size"]):
+            deltas = pending_like_deltas([post.pk for post in batch])
+            stale = []
+            for post in batch:
+                checked += 1
+                post.likes_total -= deltas.get(post.pk, 0)
+                if all(
+                    getattr(post, field) == getattr(post, actual)
+                    for field, actual in COUNTERS
+                ):
+                    continue
+                broken += 1
+                self.stdout.write(
+                    f"Пост {post.pk}: лайков {post.like_count} "
+                    f"вместо {post.likes_total}, комментариев "
+                    f"{post.comment_count} вместо {post.comments_total}"
+                )
+                for field, actual in COUNTERS:
+                    setattr(post, field, getattr(post, actual))
+                stale.append(post)
+            if options["fix"] and stale:
+                Post.objects.bulk_update(
+                    stale, [field for field, _ in COUNTERS]
+                )
+        status = "исправлено" if options["fix"] else "с расхождениями"
+        self.stdout.write(
+            self.style.SUCCESS(f"Проверено: {checked}, {status}: {broken}")
+        )
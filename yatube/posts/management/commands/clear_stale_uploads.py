@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = "Удаляет загрузки кусками, которые так и не прикрепили к посту"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=24,
+            help="Удалять загрузки старше этого числа часов",
+        )
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(hours=options["hours"])
+        stale = ImageUpload.objects.filter(created__lt=deadline)
+        count = 0
+        for upload in stale:
+            upload.discard()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Удалено загрузок: {count}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.likes import flush_like_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит накопленные в кэше изменения счётчиков лайков в БД. "
+        "Запускайте по расписанию и перед остановкой сервиса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        flushed = flush_like_counts(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Обновлены счётчики {flushed} постов")
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from posts.models import Post
+from posts.search import ensure_index, is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестраивает полнотекстовый индекс постов и восстанавливает "
+        "его триггеры, если их нет"
+    )
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError("Полнотекстовый индекс есть только в SQLite")
+        try:
+            if not ensure_index():
+                rebuild_index()
+        except DatabaseError as error:
+            raise CommandError(
+                f"Не удалось перестроить индекс, примените миграции: {error}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Индекс перестроен: {Post.objects.count()} постов"
+            )
+        )
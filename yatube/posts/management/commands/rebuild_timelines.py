@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Пересобирает ленты подписок всех пользователей с нуля"
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.values_list("user_id", "author_id")
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            for user_id, author_id in follows.iterator():
+                TimelineEntry.objects.backfill(user_id, author_id)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Записей в лентах: {TimelineEntry.objects.count()}"
+            )
+        )
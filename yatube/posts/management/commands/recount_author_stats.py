@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import AuthorStats, Follow, Post
+
+User = get_user_model()
+
+COUNTERS = (
+    ("post_count", Post, "author_id"),
+    ("follower_count", Follow, "author_id"),
+    ("following_count", Follow, "user_id"),
+)
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики постов и подписок авторов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def actual_counts(self):
+        counts = {}
+        for field, model, key in COUNTERS:
+            rows = model.objects.values(key).annotate(total=Count("pk"))
+            for row in rows.iterator():
+                counts.setdefault(row[key], {})[field] = row["total"]
+        return counts
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        fields = [field for field, _, _ in COUNTERS]
+        counts = self.actual_counts()
+        users = User.objects.values_list("pk", flat=True)
+        stale, missing = [], []
+        with transaction.atomic():
+            stored = AuthorStats.objects.in_bulk()
+            for user_id in users.iterator():
+                actual = counts.get(user_id, {})
+                stats = stored.get(user_id)
+                if stats is None:
+                    missing.append(AuthorStats(user_id=user_id, **actual))
+                    continue
+                if any(
+                    getattr(stats, field) != actual.get(field, 0)
+                    for field in fields
+                ):
+                    for field in fields:
+                        setattr(stats, field, actual.get(field, 0))
+                    stale.append(stats)
+            AuthorStats.objects.bulk_create(missing, batch_size=batch_size)
+            AuthorStats.objects.bulk_update(
+                stale, fields, batch_size=batch_size
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано: {len(missing)}, исправлено: {len(stale)}"
+            )
+        )
@@ -0,0 +1,110 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import delete_thumbnails, generate_thumbnails
+
+CHECKPOINT = os.path.join(
+    settings.BASE_DIR, "regenerate_thumbnails.checkpoint"
+)
+
+
+def regenerate(name):
+    """Удаляет миниатюры картинки и строит их заново; возвращает их число."""
+    storage = Post._meta.get_field("image").storage
+    if not storage.exists(name):
+        return 0
+    delete_thumbnails(name)
+    return generate_thumbnails(name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестраивает миниатюры всех картинок постов в пуле процессов. "
+        "После каждой пачки запоминает, докуда дошёл, и при повторном "
+        "запуске продолжает с этого места"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count(),
+            help="Число процессов; 1 — без пула, в текущем процессе",
+        )
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--checkpoint", default=CHECKPOINT)
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Начать сначала, не глядя на сохранённый прогресс",
+        )
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as checkpoint:
+                return int(checkpoint.read())
+        except (OSError, ValueError):
+            return 0
+
+    def write_checkpoint(self, path, last_pk):
+        with open(path + ".tmp", "w") as checkpoint:
+            checkpoint.write(str(last_pk))
+        os.replace(path + ".tmp", path)
+
+    def batches(self, last_pk, batch_size):
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .exclude(image="")
+                .order_by("pk")
+                .values_list("pk", "image")[:batch_size]
+            )
+            if not batch:
+                return
+            last_pk = batch[-1][0]
+            # Общий файл у постов пачки перестраивается один раз
+            yield last_pk, sorted({name for _, name in batch})
+
+    def handle(self, *args, **options):
+        path = options["checkpoint"]
+        last_pk = 0 if options["restart"] else self.read_checkpoint(path)
+        if last_pk:
+            self.stdout.write(f"Продолжаем после поста {last_pk}")
+        pool = None
+        if options["processes"] > 1:
+            # Дочерние процессы откроют свои соединения с БД
+            connections.close_all()
+            pool = ProcessPoolExecutor(options["processes"])
+        run = pool.map if pool else map
+        images = thumbnails = failed = 0
+        started = time.perf_counter()
+        try:
+            for last_pk, names in self.batches(last_pk, options["batch_size"]):
+                for count in run(regenerate, names):
+                    images += 1
+                    thumbnails += count
+                    failed += not count
+                self.write_checkpoint(path, last_pk)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"До поста {last_pk}: картинок {images}, "
+                    f"{images / elapsed:.1f} картинок/с, "
+                    f"{thumbnails / elapsed:.1f} миниатюр/с"
+                )
+        finally:
+            if pool:
+                pool.shutdown()
+        if os.path.exists(path):
+            os.remove(path)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Картинок: {images}, миниатюр: {thumbnails}, "
+                f"с ошибками: {failed}"
+            )
+        )
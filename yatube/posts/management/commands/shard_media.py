@@ -0,0 +1,84 @@
+import os
+import shutil
+
+from core.storage import is_sharded
+from django.core.management.base import BaseCommand
+
+from posts.cache import bump_generations, post_scopes
+from posts.models import Post
+from posts.thumbnails import delete_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит картинки постов из плоского каталога в подкаталоги по "
+        "хэшу содержимого и переписывает Post.image. Прерванный запуск "
+        "можно повторить: перенесённые файлы пропускаются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def batches(self, batch_size):
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .exclude(image="")
+                .order_by("pk")
+                .only("pk", "image")[:batch_size]
+            )
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def move(self, storage, name):
+        """Переносит файл и возвращает новое имя.
+
+        Сначала создаётся новый файл, затем переписываются посты и только
+        потом удаляется старый, так что прерваться можно на любом шаге.
+        """
+        with storage.open(name) as content:
+            new_name = storage.content_name(name, content)
+        if not storage.exists(new_name):
+            path = storage.path(new_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(storage.path(name), path)
+            except OSError:
+                shutil.copy2(storage.path(name), path)
+        Post.objects.filter(image=name).update(image=new_name)
+        delete_thumbnails(name)
+        storage.delete(name)
+        return new_name
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field("image")
+        storage = field.storage
+        moved = missing = 0
+        for batch in self.batches(options["batch_size"]):
+            names = {
+                post.image.name
+                for post in batch
+                if post.image.name.startswith(field.upload_to)
+                and not is_sharded(post.image.name)
+            }
+            for name in sorted(names):
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f"Нет файла {name}")
+                    continue
+                new_name = self.move(storage, name)
+                moved += 1
+                self.stdout.write(f"{name} -> {new_name}")
+                posts = Post.objects.filter(image=new_name).select_related(
+                    "author", "group"
+                )
+                for post in posts:
+                    bump_generations(*post_scopes(post))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Перенесено файлов: {moved}, не найдено: {missing}"
+            )
+        )
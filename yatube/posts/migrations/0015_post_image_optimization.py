@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:12
+
+import core.images
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_imageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_bytes_saved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', validators=[core.images.validate_image_pixels], verbose_name='Картинка'),
+        ),
+    ]
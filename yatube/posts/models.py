@@ -1,8 +1,36 @@
+import os
+import uuid
+from contextlib import suppress
+
+from core.images import validate_image_pixels
+from core.storage import ContentAddressedStorage
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.images import get_image_dimensions
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models, transaction
+from django.db.models import F
 
 User = get_user_model()
 
+TIMELINE_BATCH_SIZE = 500
+
+FEED_FIELDS = (
+    "text",
+    "pub_date",
+    "image",
+    "image_width",
+    "image_height",
+    "like_count",
+    "comment_count",
+    "author",
+    "author__username",
+    "author__first_name",
+    "author__last_name",
+    "group",
+)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -13,6 +41,15 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Карточки ленты: автор одним JOIN, только нужные поля.
+
+        Группы берутся из каталога: ``posts.catalog.attach_groups``.
+        """
+        return self.select_related("author").only(*FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
@@ -26,20 +63,75 @@ class Post(models.Model):
         related_name="posts",
         on_delete=models.SET_NULL,
     )
-    image = models.ImageField("Картинка", upload_to="posts/", blank=True)
+    image = models.ImageField(
+        "Картинка",
+        upload_to="posts/",
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True,
+        validators=[validate_image_pixels],
+    )
+    # Размеры оригинала, чтобы не открывать файл ради width/height
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False
+    )
+    # Сколько байт сэкономило пережатие оригинала при загрузке
+    image_bytes_saved = models.PositiveIntegerField(
+        default=0, editable=False
+    )
 
     likes = models.ManyToManyField(User, related_name="likes")
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    objects = PostQuerySet.as_manager()
 
     def likes_count(self):
-        return self.likes.count()
+        return self.like_count
+
+    def read_image_dimensions(self):
+        """Размеры из файла картинки или (None, None), если его не прочесть."""
+        image = self.image
+        if not image:
+            return None, None
+        try:
+            if image._committed:
+                with image.storage.open(image.name) as file:
+                    return get_image_dimensions(file)
+            return get_image_dimensions(image.file)
+        except (OSError, SuspiciousFileOperation):
+            return None, None
 
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx",
+            ),
+            models.Index(
+                fields=["-pub_date", "-id"], name="post_pub_date_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
+class CommentQuerySet(models.QuerySet):
+    def with_authors(self):
+        return self.select_related("author").only(
+            "post", "text", "created", "author", "author__username"
+        )
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -54,6 +146,15 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "created"], name="comment_post_created_idx"
+            )
+        ]
+
     def __str__(self) -> str:
         return self.text
 
@@ -72,6 +173,181 @@ class Follow(models.Model):
                 fields=["user", "author"], name="unique_following"
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user} → {self.author}"
+
+
+class TimelineQuerySet(models.QuerySet):
+    def for_feed(self):
+        return self.select_related("post__author").only(
+            "user",
+            "pub_date",
+            "post",
+            *(f"post__{field}" for field in FEED_FIELDS),
+        )
+
+    def fan_out(self, post):
+        followers = Follow.objects.filter(author_id=post.author_id)
+        self.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id, post_id=post.pk, pub_date=post.pub_date
+                )
+                for user_id in followers.values_list("user_id", flat=True)
+            ),
+            batch_size=TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def backfill(self, user_id, author_id):
+        posts = Post.objects.filter(author_id=author_id).values_list(
+            "pk", "pub_date"
+        )
+        self.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts.iterator()
+            ),
+            batch_size=TIMELINE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def drop(self, user_id, author_id):
+        return self.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост)."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    pub_date = models.DateTimeField()
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["-pub_date", "-post_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="unique_timeline_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="timeline_user_pub_date_idx",
+            )
+        ]
 
     def __str__(self):
-        return self.author
+        return f"{self.user_id}: {self.post_id}"
+
+
+class AuthorStatsQuerySet(models.QuerySet):
+    def count_for(self, user_id):
+        return {
+            "post_count": Post.objects.filter(author_id=user_id).count(),
+            "follower_count": Follow.objects.filter(author_id=user_id).count(),
+            "following_count": Follow.objects.filter(user_id=user_id).count(),
+        }
+
+    def recount(self, user_id):
+        stats, _ = self.update_or_create(
+            user_id=user_id, defaults=self.count_for(user_id)
+        )
+        return stats
+
+    def bump(self, user_id, create_missing=True, **deltas):
+        queryset = self.filter(user_id=user_id)
+        for field, delta in deltas.items():
+            if delta < 0:
+                queryset = queryset.filter(**{f"{field}__gte": -delta})
+        with transaction.atomic():
+            updated = queryset.update(
+                **{field: F(field) + delta for field, delta in deltas.items()}
+            )
+            if not updated and create_missing:
+                self.recount(user_id)
+
+    def get_for(self, user):
+        try:
+            return user.stats
+        except AuthorStats.DoesNotExist:
+            return self.recount(user.pk)
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора, их обновляют сигналы."""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    post_count = models.PositiveIntegerField(default=0)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    objects = AuthorStatsQuerySet.as_manager()
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class ImageUploadQuerySet(models.QuerySet):
+    def completed_for(self, user, upload_id):
+        """Полностью загруженная картинка пользователя или None."""
+        if not upload_id:
+            return None
+        try:
+            return self.get(pk=upload_id, user=user, received=F("size"))
+        except (ImageUpload.DoesNotExist, ValidationError):
+            return None
+
+
+class ImageUpload(models.Model):
+    """Картинка, которую клиент загружает кусками до отправки формы."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="image_uploads"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageUploadQuerySet.as_manager()
+
+    @property
+    def path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_ROOT, f"{self.pk}.part")
+
+    @property
+    def complete(self):
+        return self.received == self.size
+
+    def open(self):
+        """Загруженный файл в виде, который принимает ``PostForm``."""
+        return UploadedFile(
+            open(self.path, "rb"), name=self.filename, size=self.size
+        )
+
+    def discard(self):
+        """Удаляет загрузку, а её файл — после коммита транзакции."""
+        path = self.path
+        self.delete()
+
+        def remove():
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+        transaction.on_commit(remove)
@@ -0,0 +1,178 @@
+"""Полнотекстовый поиск по постам через индекс SQLite FTS5.
+
+Индекс ``posts_post_fts`` хранит только токены текста постов и
+обновляется триггерами на ``posts_post``, поэтому в синхронизации
+участвуют и ``bulk_create``, и ``QuerySet.update``.
+"""
+import base64
+import binascii
+import re
+
+from django.core.paginator import Page, Paginator
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = "posts_post_fts"
+TOKEN_RE = re.compile(r"\w+")
+
+TRIGGERS = {
+    "posts_post_fts_insert": (
+        "CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert "
+        "AFTER INSERT ON posts_post BEGIN "
+        "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); "
+        "END"
+    ),
+    "posts_post_fts_delete": (
+        "CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete "
+        "AFTER DELETE ON posts_post BEGIN "
+        "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        "END"
+    ),
+    "posts_post_fts_update": (
+        "CREATE TRIGGER IF NOT EXISTS posts_post_fts_update "
+        "AFTER UPDATE OF text ON posts_post BEGIN "
+        "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        "INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); "
+        "END"
+    ),
+}
+
+
+def is_available(using=connection):
+    return using.vendor == "sqlite"
+
+
+def ensure_index(using=connection):
+    """Восстанавливает триггеры индекса и перестраивает его, если их не было.
+
+    SQLite удаляет триггеры вместе с таблицей, а миграции, меняющие поля
+    ``Post``, пересоздают ``posts_post``. Возвращает True, если индекс
+    пришлось перестроить.
+    """
+    if not is_available(using):
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master WHERE name = %s "
+            "OR (type = 'trigger' AND tbl_name = 'posts_post')",
+            [FTS_TABLE],
+        )
+        existing = {name for _, name in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            return False
+        missing = set(TRIGGERS) - existing
+        if not missing:
+            return False
+        for name in sorted(missing):
+            cursor.execute(TRIGGERS[name])
+    rebuild_index(using)
+    return True
+
+
+def rebuild_index(using=connection):
+    """Заново строит индекс по текущему содержимому ``posts_post``."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"
+        )
+
+
+def build_match(query):
+    """Строка пользователя в выражение MATCH или None, если слов нет.
+
+    Каждое слово берётся в кавычки, чтобы OR, NOT и NEAR не стали
+    операторами; последнее ищется как префикс.
+    """
+    terms = [f'"{token}"' for token in TOKEN_RE.findall(query or "")]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def matching_ids_sql(match):
+    """SQL и параметры подзапроса с id подходящих постов для ``RawSQL``."""
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [
+        match
+    ]
+
+
+def search(match, limit, after=None):
+    """До ``limit`` пар ``(id, rank)`` по релевантности, затем по id.
+
+    ``after`` — пара последнего результата предыдущей страницы. Меньший
+    ``rank`` (bm25) означает более релевантный пост.
+    """
+    sql = f"SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    params = [match]
+    if after is not None:
+        rank, pk = after
+        sql += " AND (rank > %s OR (rank = %s AND rowid > %s))"
+        params += [rank, rank, pk]
+    sql += " ORDER BY rank, rowid LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def encode_cursor(rank, pk):
+    raw = f"{rank!r}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Возвращает (rank, pk) или None для битого токена."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        rank, pk = raw.rsplit("|", 1)
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+class SearchPaginator(Paginator):
+    """Keyset-пагинатор результатов поиска по (rank, id).
+
+    Устроен как ``CursorPaginator``, но листает только вперёд: ранги
+    зависят от всего корпуса, и обратный ход по ним ничего не даёт.
+    """
+
+    cursor_mode = True
+
+    def __init__(self, match, per_page):
+        super().__init__([], per_page)
+        self.match = match
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._number = 1
+        self._has_next = False
+
+    @property
+    def num_pages(self):
+        return self._number + int(self._has_next)
+
+    def get_cursor_page(self, after=None):
+        cursor = decode_cursor(after)
+        rows = search(self.match, self.per_page + 1, cursor)
+        if not rows and cursor is not None:
+            return self.get_cursor_page()
+        self._has_next = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        self._number = 1 if cursor is None else 2
+        if self._has_next:
+            pk, rank = rows[-1]
+            self.next_cursor = encode_cursor(rank, pk)
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _ in rows])
+        return Page(
+            [posts[pk] for pk, _ in rows if pk in posts], self._number, self
+        )
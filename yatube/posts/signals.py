@@ -0,0 +1,232 @@
+import logging
+import os
+
+from core.images import optimize_image
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .cache import (
+    GLOBAL_SCOPE,
+    author_scope,
+    bump_generations,
+    group_scope,
+    post_scopes,
+)
+from .catalog import group_catalog
+from .models import AuthorStats, Comment, Follow, Group, Post, TimelineEntry
+from .thumbnails import delete_thumbnails
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def drop_timeline(sender, instance, **kwargs):
+    TimelineEntry.objects.drop(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, post_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    AuthorStats.objects.bump(
+        instance.author_id, create_missing=False, post_count=-1
+    )
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, follower_count=1)
+        AuthorStats.objects.bump(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    AuthorStats.objects.bump(
+        instance.author_id, create_missing=False, follower_count=-1
+    )
+    AuthorStats.objects.bump(
+        instance.user_id, create_missing=False, following_count=-1
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_state(sender, instance, **kwargs):
+    if instance.pk:
+        previous = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list("group__slug", "image")
+            .first()
+        )
+        if previous is not None:
+            instance._previous_group_slug, instance._previous_image = previous
+
+
+@receiver(pre_save, sender=Post)
+def optimize_uploaded_image(sender, instance, **kwargs):
+    """Ужимает новый оригинал до сохранения и хеширования файла."""
+    image = instance.image
+    if not image or image._committed:
+        return
+    try:
+        optimized = optimize_image(image.file)
+    except (OSError, SyntaxError):
+        logger.warning("Не удалось пережать картинку %s", image.name)
+        return
+    if optimized is None:
+        instance.image_bytes_saved = 0
+        return
+    instance.image_bytes_saved = max(image.file.size - optimized.size, 0)
+    instance.image = optimized
+    logger.info(
+        "Картинка %s ужата на %d байт", image.name, instance.image_bytes_saved
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_new_image(sender, instance, **kwargs):
+    image = instance.image
+    if image and not image._committed:
+        instance._new_image_file = image.file
+
+
+@receiver(post_save, sender=Post)
+def keep_new_image_stored(sender, instance, **kwargs):
+    content = instance.__dict__.pop("_new_image_file", None)
+    if content is not None:
+        name = instance.image.name
+        transaction.on_commit(lambda: restore_missing_image(name, content))
+
+
+@receiver(pre_save, sender=Post)
+def store_image_dimensions(sender, instance, **kwargs):
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+    elif (
+        not image._committed
+        or image.name != getattr(instance, "_previous_image", None)
+        or instance.image_width is None
+    ):
+        width, height = instance.read_image_dimensions()
+        instance.image_width, instance.image_height = width, height
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    scopes = post_scopes(instance)
+    previous_group_slug = getattr(instance, "_previous_group_slug", None)
+    if previous_group_slug:
+        scopes.append(group_scope(previous_group_slug))
+    bump_generations(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post_pages(sender, instance, **kwargs):
+    post = (
+        Post.objects.select_related("author", "group")
+        .filter(pk=instance.post_id)
+        .first()
+    )
+    if post is not None:
+        bump_generations(*post_scopes(post))
+
+
+@receiver(m2m_changed, sender=Post.likes.through)
+def invalidate_liked_post_pages(sender, instance, action, reverse, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear") and not reverse:
+        bump_generations(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_followed_author_pages(sender, instance, **kwargs):
+    bump_generations(author_scope(instance.author.username))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    bump_generations(GLOBAL_SCOPE, group_scope(instance.slug))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_catalog(sender, instance, **kwargs):
+    group_catalog.invalidate()
+    # Каталог, перечитанный до коммита, мог увидеть откатываемые данные
+    transaction.on_commit(group_catalog.invalidate)
+
+
+def delete_unused_image(name):
+    """Удаляет файл картинки и её миниатюры, если на неё не ссылаются посты.
+
+    Одинаковые загрузки хранятся одним файлом, поэтому число ссылок —
+    это число постов с таким же ``image``. Гонку с параллельной такой же
+    загрузкой закрывают ``delete_unreferenced`` и ``restore_missing_image``.
+    """
+    storage = Post._meta.get_field("image").storage
+    if storage.delete_unreferenced(
+        name, Post.objects.filter(image=name).exists
+    ):
+        delete_thumbnails(name)
+
+
+def restore_missing_image(name, content):
+    """Дописывает файл нового поста, если его удалили до коммита поста.
+
+    ``save`` не пишет файл, который уже есть; если последний пост со
+    старой копией удалили между этой проверкой и коммитом, пост
+    остался бы без файла.
+    """
+    field = Post._meta.get_field("image")
+    if content.closed or field.storage.exists(name):
+        return
+    logger.warning("Файл %s удалён до коммита поста, записываем заново", name)
+    content.seek(0)
+    # Имя считается по содержимому заново, поэтому отдаём только каталог
+    field.storage.save(
+        os.path.join(field.upload_to, os.path.basename(name)), content
+    )
+
+
+def release_image(name):
+    upload_to = Post._meta.get_field("image").upload_to
+    if name and name.startswith(upload_to):
+        transaction.on_commit(lambda: delete_unused_image(name))
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, **kwargs):
+    previous_image = getattr(instance, "_previous_image", None)
+    if previous_image != instance.image.name:
+        release_image(previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
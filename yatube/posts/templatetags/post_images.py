@@ -0,0 +1,21 @@
+from django import template
+
+from ..thumbnails import attach_pictures, get_responsive_images
+
+register = template.Library()
+
+
+@register.simple_tag
+def load_pictures(page_obj, geometry):
+    """Одним запросом готовит картинки всех постов страницы.
+
+    После тега у каждого поста есть ``post.picture``.
+    """
+    attach_pictures(page_obj[:], geometry)
+    return ""
+
+
+@register.simple_tag
+def post_picture(post, geometry):
+    """Картинка одного поста для ``posts/includes/post_picture.html``."""
+    return get_responsive_images([post], geometry).get(post.pk)
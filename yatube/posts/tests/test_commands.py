@@ -0,0 +1,342 @@
+import os
+import re
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from posts.likes import (
+    CACHE_ALIAS,
+    FLUSH_LOCK_KEY,
+    flush_like_counts,
+    record_like,
+    set_like,
+)
+from posts.models import AuthorStats, Comment, Follow, Post, TimelineEntry
+from posts.search import build_match, search
+from posts.thumbnails import (
+    _variant_requests,
+    generate_thumbnails,
+    get_ready_thumbnails,
+)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x02\x00"
+    b"\x01\x00\x80\x00\x00\x00\x00\x00"
+    b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+    b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+    b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+    b"\x0A\x00\x3B"
+)
+
+
+class RebuildTimelinesCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="reader")
+        cls.author = User.objects.create_user(username="author")
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f"text {i}")
+            for i in range(3)
+        ]
+
+    def test_rebuild_timelines(self):
+        TimelineEntry.objects.all().delete()
+        TimelineEntry.objects.create(
+            user=self.author,
+            post=self.posts[0],
+            pub_date=self.posts[0].pub_date,
+        )
+
+        call_command("rebuild_timelines", stdout=StringIO())
+
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list("user_id", "post_id")),
+            {(self.reader.pk, post.pk) for post in self.posts},
+        )
+
+
+class RecountAuthorStatsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="reader")
+        cls.author = User.objects.create_user(username="author")
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Post.objects.create(author=cls.author, text="text")
+
+    def test_signals_keep_stats_in_sync(self):
+        self.assertEqual(self.author.stats.post_count, 1)
+        self.assertEqual(self.author.stats.follower_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+
+    def test_recount_repairs_drift(self):
+        AuthorStats.objects.filter(user=self.author).update(
+            post_count=7, follower_count=0
+        )
+        AuthorStats.objects.filter(user=self.reader).delete()
+
+        call_command("recount_author_stats", stdout=StringIO())
+
+        author_stats = AuthorStats.objects.get(user=self.author)
+        reader_stats = AuthorStats.objects.get(user=self.reader)
+        self.assertEqual(author_stats.post_count, 1)
+        self.assertEqual(author_stats.follower_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+        self.assertEqual(reader_stats.post_count, 0)
+
+
+class CheckPostCountersCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="user")
+        cls.post = Post.objects.create(author=cls.user, text="text")
+        cls.post.likes.add(cls.user)
+        Comment.objects.create(post=cls.post, author=cls.user, text="text")
+
+    def test_check_reports_without_fixing(self):
+        out = StringIO()
+        call_command("check_post_counters", stdout=out)
+        self.assertIn(f"Пост {self.post.pk}", out.getvalue())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 0)
+
+    def setUp(self):
+        self.likes_cache = caches[CACHE_ALIAS]
+        self.likes_cache.clear()
+
+    def test_fix(self):
+        call_command("check_post_counters", "--fix", stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.like_count, 1)
+        self.assertEqual(post.comment_count, 1)
+
+    def test_fix_counts_likes_and_comments_independently(self):
+        reader = User.objects.create_user(username="reader")
+        self.post.likes.add(reader)
+        for _ in range(2):
+            Comment.objects.create(post=self.post, author=reader, text="text")
+
+        call_command("check_post_counters", "--fix", stdout=StringIO())
+
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.like_count, post.comment_count), (2, 3))
+
+    def like_later(self):
+        reader = User.objects.create_user(username="reader")
+        set_like(self.post.pk, reader.pk, True)
+        record_like(self.post.pk, True)
+
+    def test_fix_flushes_pending_likes_first(self):
+        self.like_later()
+
+        call_command("check_post_counters", "--fix", stdout=StringIO())
+        flush_like_counts()
+
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 2)
+
+    def test_fix_leaves_room_for_unflushed_likes(self):
+        self.like_later()
+        # сброс уже идёт в другом процессе
+        self.likes_cache.add(FLUSH_LOCK_KEY, 1, None)
+
+        call_command("check_post_counters", "--fix", stdout=StringIO())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 1)
+
+        self.likes_cache.delete(FLUSH_LOCK_KEY)
+        flush_like_counts()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ShardMediaCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    def setUp(self):
+        cache.clear()
+        self.storage = Post._meta.get_field("image").storage
+        os.makedirs(os.path.join(self.storage.location, "posts"))
+        for name in ("posts/old.gif", "posts/copy.gif"):
+            with open(self.storage.path(name), "wb") as image:
+                image.write(SMALL_GIF)
+        self.posts = [
+            Post.objects.create(author=self.author, text="text", image=name)
+            for name in ("posts/old.gif", "posts/copy.gif", "posts/old.gif")
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.storage.location, ignore_errors=True)
+
+    def test_shard_media(self):
+        call_command("shard_media", batch_size=2, stdout=StringIO())
+
+        names = {post.image.name for post in Post.objects.all()}
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertRegex(name, r"^posts/(..)/(..)/\1\2[0-9a-f]{60}\.gif$")
+        self.assertTrue(self.storage.exists(name))
+        self.assertFalse(self.storage.exists("posts/old.gif"))
+        self.assertFalse(self.storage.exists("posts/copy.gif"))
+
+    def test_thumbnails_of_moved_file_removed(self):
+        requests = _variant_requests("posts/old.gif")
+        generate_thumbnails("posts/old.gif")
+        thumbnails = get_ready_thumbnails(requests).values()
+        self.assertNotIn(None, thumbnails)
+
+        call_command("shard_media", stdout=StringIO())
+
+        self.assertEqual(
+            set(get_ready_thumbnails(requests).values()), {None}
+        )
+        for thumbnail in thumbnails:
+            self.assertFalse(thumbnail.exists())
+
+    def test_rerun_skips_moved_files(self):
+        call_command("shard_media", stdout=StringIO())
+        out = StringIO()
+
+        call_command("shard_media", stdout=out)
+
+        self.assertIn("Перенесено файлов: 0", out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackfillImageDimensionsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    def tearDown(self):
+        shutil.rmtree(
+            Post._meta.get_field("image").storage.location, ignore_errors=True
+        )
+
+    def test_backfill_image_dimensions(self):
+        storage = Post._meta.get_field("image").storage
+        name = storage.save("posts/small.gif", ContentFile(SMALL_GIF))
+        post = Post.objects.create(author=self.author, text="text", image=name)
+        missing = Post.objects.create(
+            author=self.author, text="text", image="posts/missing.gif"
+        )
+        Post.objects.update(image_width=None, image_height=None)
+
+        call_command(
+            "backfill_image_dimensions", stdout=StringIO(), stderr=StringIO()
+        )
+
+        post.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertIsNone(missing.image_width)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), THUMBNAIL_ASYNC=False)
+class RegenerateThumbnailsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    def setUp(self):
+        cache.clear()
+        self.storage = Post._meta.get_field("image").storage
+        self.checkpoint = os.path.join(self.storage.location, "checkpoint")
+        self.posts = [
+            Post.objects.create(
+                author=self.author,
+                text="text",
+                image=self.storage.save(
+                    "posts/image.gif",
+                    ContentFile(SMALL_GIF + bytes([i])),
+                ),
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.storage.location, ignore_errors=True)
+
+    def regenerate(self, *args):
+        out = StringIO()
+        call_command(
+            "regenerate_thumbnails",
+            *args,
+            processes=1,
+            checkpoint=self.checkpoint,
+            batch_size=2,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_regenerate_thumbnails(self):
+        output = self.regenerate()
+
+        self.assertIn("Картинок: 3", output)
+        self.assertIn("с ошибками: 0", output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertTrue(self.storage.exists("cache"))
+
+    def test_regenerate_existing_thumbnails(self):
+        first = self.regenerate()
+
+        second = self.regenerate()
+
+        self.assertIn("с ошибками: 0", second)
+        self.assertEqual(
+            re.search(r"миниатюр: (\d+)", second).group(1),
+            re.search(r"миниатюр: (\d+)", first).group(1),
+        )
+
+    def test_resume_after_interruption(self):
+        with open(self.checkpoint, "w") as checkpoint:
+            checkpoint.write(str(self.posts[1].pk))
+
+        output = self.regenerate()
+
+        self.assertIn(f"Продолжаем после поста {self.posts[1].pk}", output)
+        self.assertIn("Картинок: 1", output)
+
+    def test_restart_ignores_checkpoint(self):
+        with open(self.checkpoint, "w") as checkpoint:
+            checkpoint.write(str(self.posts[1].pk))
+
+        self.assertIn("Картинок: 3", self.regenerate("--restart"))
+
+
+class RebuildSearchIndexCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="user")
+
+    def test_restores_triggers_and_index(self):
+        # SQLite теряет триггеры, когда миграция пересоздаёт posts_post
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER posts_post_fts_insert")
+        post = Post.objects.create(author=self.user, text="потерянный пост")
+        self.assertEqual(search(build_match("потерянный"), 10), [])
+
+        call_command("rebuild_search_index", stdout=StringIO())
+
+        self.assertEqual(
+            [pk for pk, _ in search(build_match("потерянный"), 10)],
+            [post.pk],
+        )
+        fresh = Post.objects.create(author=self.user, text="новый пост")
+        self.assertEqual(
+            [pk for pk, _ in search(build_match("новый"), 10)], [fresh.pk]
+        )
@@ -1,12 +1,29 @@
+import hashlib
+import io
+import os
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
 from django.urls import reverse
-from posts.models import Comment, Group, Post
+from posts.likes import CACHE_ALIAS, flush_like_counts
+from posts.models import Comment, Group, ImageUpload, Post
+from posts.thumbnails import (
+    _variant_requests,
+    generate_thumbnails,
+    get_ready_thumbnails,
+)
+from PIL import Image
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
@@ -80,7 +97,10 @@ class PostsCreatePostTest(TestCase):
         self.assertEqual(post.text, self.post.text)
         self.assertEqual(post.group, self.post.group)
         self.assertEqual(post.author, self.post.author)
-        self.assertEqual(self.post.image, "posts/small.gif")
+        self.assertRegex(
+            self.post.image.name,
+            r"^posts/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.gif$",
+        )
 
     def test_edit_post(self):
         posts_count = Post.objects.count()
@@ -139,6 +159,33 @@ class PostsCreatePostTest(TestCase):
         self.assertEqual(comment.text, form_data["text"])
         self.assertEqual(comment.author, self.user)
 
+    def test_comment_counter(self):
+        comment_count = Post.objects.get(pk=self.post.pk).comment_count
+        self.authorized_client.post(
+            reverse("posts:add_comment", kwargs={"post_id": self.post.id}),
+            data={"text": "Текст комментария"},
+        )
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comment_count, comment_count + 1
+        )
+        comment = Comment.objects.filter(post=self.post).first()
+        self.authorized_client.get(
+            reverse("posts:delete_comment", kwargs={"comment_id": comment.id})
+        )
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comment_count, comment_count
+        )
+
+    def test_like_counter(self):
+        caches[CACHE_ALIAS].clear()
+        like_url = reverse("posts:likes", kwargs={"post_id": self.post.id})
+        self.authorized_client.post(like_url)
+        flush_like_counts()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 1)
+        self.authorized_client.post(like_url)
+        flush_like_counts()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 0)
+
     def test_comment_for_guest_client(self):
         comments_count = Comment.objects.count()
         form_data = {"text": "Текст комментария"}
@@ -155,3 +202,290 @@ class PostsCreatePostTest(TestCase):
             + reverse("posts:add_comment", kwargs={"post_id": self.post.id}),
         )
         self.assertEqual(Comment.objects.count(), comments_count)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
+class PostImageDeduplicationTest(TransactionTestCase):
+    small_gif = (
+        b"\x47\x49\x46\x38\x39\x61\x02\x00"
+        b"\x01\x00\x80\x00\x00\x00\x00\x00"
+        b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+        b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+        b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+        b"\x0A\x00\x3B"
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="author")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, name):
+        image = SimpleUploadedFile(
+            name=name, content=self.small_gif, content_type="image/gif"
+        )
+        self.client.post(
+            reverse("posts:post_create"), data={"text": name, "image": image}
+        )
+        return Post.objects.get(text=name)
+
+    def test_identical_uploads_share_file(self):
+        first = self.upload("first.gif")
+        second = self.upload("second.gif")
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.assertEqual(
+            first.image.name, f"posts/{digest[:2]}/{digest[2:4]}/{digest}.gif"
+        )
+        self.assertEqual(second.image.name, first.image.name)
+
+    def test_image_dimensions_stored_on_save(self):
+        post = self.upload("first.gif")
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, 'width="960" height="450"')
+
+    def test_file_removed_with_last_post(self):
+        first = self.upload("first.gif")
+        second = self.upload("second.gif")
+        path = first.image.path
+
+        self.client.get(reverse("posts:post_delete", args=(first.pk,)))
+        self.assertTrue(os.path.exists(path))
+
+        self.client.get(reverse("posts:post_delete", args=(second.pk,)))
+        self.assertFalse(os.path.exists(path))
+
+    def test_thumbnails_removed_with_last_post(self):
+        post = self.upload("first.gif")
+        requests = _variant_requests(post.image.name)
+        generate_thumbnails(post.image.name)
+        thumbnails = get_ready_thumbnails(requests).values()
+        self.assertNotIn(None, thumbnails)
+
+        self.client.get(reverse("posts:post_delete", args=(post.pk,)))
+
+        self.assertEqual(
+            set(get_ready_thumbnails(requests).values()), {None}
+        )
+        for thumbnail in thumbnails:
+            self.assertFalse(thumbnail.exists())
+
+    def test_file_deleted_before_commit_is_restored(self):
+        storage = Post._meta.get_field("image").storage
+        save = storage.save
+        calls = []
+
+        def save_and_lose(name, content, max_length=None):
+            name = save(name, content, max_length)
+            if not calls:
+                # удалили последний пост с таким же файлом до коммита
+                storage.delete(name)
+            calls.append(name)
+            return name
+
+        with mock.patch.object(storage, "save", side_effect=save_and_lose):
+            post = self.upload("first.gif")
+
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(os.path.exists(post.image.path))
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    CHUNKED_UPLOAD_ROOT=os.path.join(TEMP_MEDIA_ROOT, "uploads"),
+)
+class ChunkedUploadTest(TestCase):
+    small_gif = PostImageDeduplicationTest.small_gif
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="author")
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def start(self, size=None):
+        response = self.authorized_client.post(
+            reverse("posts:upload_start"),
+            {"filename": "small.gif", "size": size or len(self.small_gif)},
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["id"]
+
+    def put(self, upload_id, offset, data):
+        return self.authorized_client.put(
+            reverse("posts:upload_chunk", args=(upload_id,))
+            + f"?offset={offset}",
+            data,
+            content_type="application/octet-stream",
+        )
+
+    def test_chunked_upload_attached_to_post(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.small_gif[:10])
+        response = self.put(upload_id, 10, self.small_gif[10:])
+        self.assertEqual(
+            response.json(),
+            {"id": upload_id, "offset": len(self.small_gif), "complete": True},
+        )
+
+        self.authorized_client.post(
+            reverse("posts:post_create"),
+            {"text": "chunked", "upload": upload_id},
+        )
+
+        post = Post.objects.get(text="chunked")
+        digest = hashlib.sha256(self.small_gif).hexdigest()
+        self.assertTrue(post.image.name.endswith(f"{digest}.gif"))
+        self.assertFalse(ImageUpload.objects.filter(pk=upload_id).exists())
+
+    def test_resume_from_server_offset(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.small_gif[:10])
+
+        response = self.put(upload_id, 20, self.small_gif[20:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 10)
+
+        response = self.authorized_client.get(
+            reverse("posts:upload_chunk", args=(upload_id,))
+        )
+        self.assertEqual(response.json()["offset"], 10)
+
+    def test_repeated_chunk_is_idempotent(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.small_gif[:10])
+        self.put(upload_id, 0, self.small_gif[:10])
+        response = self.put(upload_id, 10, self.small_gif[10:])
+        self.assertTrue(response.json()["complete"])
+        upload = ImageUpload.objects.get(pk=upload_id)
+        with open(upload.path, "rb") as part:
+            self.assertEqual(part.read(), self.small_gif)
+
+    def test_not_an_image_is_rejected_early(self):
+        upload_id = self.start(size=100 * 1024)
+
+        response = self.put(upload_id, 0, b"x" * 20 * 1024)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImageUpload.objects.filter(pk=upload_id).exists())
+
+    def test_upload_file_closed_after_form(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.small_gif)
+        open_upload = ImageUpload.open
+        opened = []
+
+        def track(upload):
+            opened.append(open_upload(upload))
+            return opened[-1]
+
+        with mock.patch.object(
+            ImageUpload, "open", autospec=True, side_effect=track
+        ):
+            for text in ("", "chunked"):
+                self.authorized_client.post(
+                    reverse("posts:post_create"),
+                    {"text": text, "upload": upload_id},
+                )
+
+        self.assertEqual(len(opened), 2)
+        self.assertTrue(all(file.closed for file in opened))
+        self.assertTrue(Post.objects.get(text="chunked").image)
+
+    def test_incomplete_upload_is_ignored_by_form(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, self.small_gif[:10])
+
+        self.authorized_client.post(
+            reverse("posts:post_create"),
+            {"text": "chunked", "upload": upload_id},
+        )
+
+        self.assertFalse(Post.objects.get(text="chunked").image)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_UPLOAD_MAX_SIDE=64)
+class ImageOptimizationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def make_jpeg(self, size):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(
+            buffer, "JPEG", quality=100, exif=exif.tobytes()
+        )
+        return SimpleUploadedFile(
+            "photo.jpg", buffer.getvalue(), content_type="image/jpeg"
+        )
+
+    def test_original_downscaled_and_stripped(self):
+        image = self.make_jpeg((256, 128))
+        self.authorized_client.post(
+            reverse("posts:post_create"), {"text": "photo", "image": image}
+        )
+
+        post = Post.objects.get(text="photo")
+        self.assertEqual((post.image_width, post.image_height), (64, 32))
+        self.assertEqual(
+            post.image_bytes_saved, image.size - post.image.size
+        )
+        self.assertGreater(post.image_bytes_saved, 0)
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (64, 32))
+            self.assertNotIn("exif", stored.info)
+
+    def test_png_metadata_stripped(self):
+        exif = Image.Exif()
+        exif[0x010F] = "SecretCam"
+        buffer = io.BytesIO()
+        Image.new("RGB", (32, 16), "red").save(
+            buffer, "PNG", exif=exif.tobytes()
+        )
+        image = SimpleUploadedFile(
+            "photo.png", buffer.getvalue(), content_type="image/png"
+        )
+        self.authorized_client.post(
+            reverse("posts:post_create"), {"text": "png", "image": image}
+        )
+
+        post = Post.objects.get(text="png")
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, "PNG")
+            self.assertNotIn("exif", stored.info)
+            self.assertEqual(dict(stored.getexif()), {})
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10 ** 6)
+    def test_decompression_bomb_rejected(self):
+        response = self.authorized_client.post(
+            reverse("posts:post_create"),
+            {"text": "bomb", "image": self.make_jpeg((1001, 1000))},
+        )
+
+        self.assertFalse(Post.objects.filter(text="bomb").exists())
+        self.assertFormError(
+            response,
+            "form",
+            "image",
+            "Слишком большое изображение: больше 1 Мп",
+        )
@@ -0,0 +1,252 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.cache import bump_generations
+from posts.catalog import CATALOG_SCOPE, group_catalog
+from posts.forms import PostForm
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import EstimatedCountPaginator
+
+User = get_user_model()
+
+
+class FeedQueryBudgetTest(TestCase):
+    """Число запросов страницы не зависит от количества постов на ней."""
+
+    QUERY_BUDGET = {
+        "posts:index": 4,
+        "posts:group_list": 4,
+        "posts:profile": 6,
+        "posts:follow_index": 4,
+        "posts:post_detail": 5,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="reader")
+        cls.author = User.objects.create_user(
+            username="author", first_name="Имя", last_name="Фамилия"
+        )
+        cls.group = Group.objects.create(
+            title="test_title",
+            slug="test_slug",
+            description="test_desc",
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.client_reader = Client()
+        cls.client_reader.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                author=self.author, group=self.group, text=f"text {i}"
+            )
+            Comment.objects.create(post=post, author=self.reader, text="text")
+            post.likes.add(self.reader)
+        return post
+
+    def urls(self, post):
+        return {
+            "posts:index": reverse("posts:index"),
+            "posts:group_list": reverse(
+                "posts:group_list", args=(self.group.slug,)
+            ),
+            "posts:profile": reverse(
+                "posts:profile", args=(self.author.username,)
+            ),
+            "posts:follow_index": reverse("posts:follow_index"),
+            "posts:post_detail": reverse("posts:post_detail", args=(post.pk,)),
+        }
+
+    def count_queries(self, url):
+        cache.clear()
+        group_catalog.all()
+        with CaptureQueriesContext(connection) as context:
+            self.client_reader.get(url)
+        return len(context)
+
+    def test_query_budget(self):
+        post = self.create_posts(1)
+        for name, url in self.urls(post).items():
+            with self.subTest(name=name):
+                cache.clear()
+                group_catalog.all()
+                with self.assertNumQueries(self.QUERY_BUDGET[name]):
+                    self.client_reader.get(url)
+
+    def test_query_count_does_not_grow_with_posts(self):
+        post = self.create_posts(1)
+        small = {
+            name: self.count_queries(url)
+            for name, url in self.urls(post).items()
+        }
+        post = self.create_posts(9)
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.author, text="text")
+            for _ in range(5)
+        )
+        for name, url in self.urls(post).items():
+            with self.subTest(name=name):
+                self.assertEqual(self.count_queries(url), small[name])
+
+    def test_thumbnail_lookups_are_batched(self):
+        post = self.create_posts(1)
+        urls = self.urls(post)
+        del urls["posts:post_detail"]
+        small = {name: self.count_queries(url) for name, url in urls.items()}
+        self.create_posts(9)
+        for number, post in enumerate(Post.objects.all()):
+            post.image = f"posts/missing_{number}.gif"
+            post.save(update_fields=["image"])
+        for name, url in urls.items():
+            with self.subTest(name=name):
+                # Одно обращение к БД хранилища миниатюр на всю страницу
+                self.assertEqual(self.count_queries(url), small[name] + 1)
+
+
+class AdminQueryBudgetTest(TestCase):
+    """Страницы админки posts не делают запросов на каждую строку."""
+
+    QUERY_BUDGET = {
+        "admin:posts_post_changelist": 5,
+        "admin:posts_post_change": 9,
+        "admin:posts_comment_changelist": 5,
+        "admin:posts_comment_change": 8,
+        "admin:posts_follow_changelist": 5,
+        "admin:posts_follow_change": 10,
+        "admin:posts_group_changelist": 5,
+        "admin:posts_group_change": 6,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="admin"
+        )
+        cls.client_admin = Client()
+        cls.client_admin.force_login(cls.admin)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_rows(self, count):
+        start = Group.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f"author{i}")
+            group = Group.objects.create(
+                title=f"group {i}", slug=f"group-{i}", description="text"
+            )
+            post = Post.objects.create(author=author, group=group, text="text")
+            comment = Comment.objects.create(
+                post=post, author=author, text="text"
+            )
+            follow = Follow.objects.create(user=self.admin, author=author)
+        return {
+            "post": post,
+            "comment": comment,
+            "follow": follow,
+            "group": group,
+        }
+
+    def urls(self, rows):
+        urls = {}
+        for name, obj in rows.items():
+            urls[f"admin:posts_{name}_changelist"] = reverse(
+                f"admin:posts_{name}_changelist"
+            )
+            urls[f"admin:posts_{name}_change"] = reverse(
+                f"admin:posts_{name}_change", args=(obj.pk,)
+            )
+        return urls
+
+    def count_queries(self, url):
+        group_catalog.all()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client_admin.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_query_budget(self):
+        urls = self.urls(self.create_rows(1))
+        for name, url in urls.items():
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.count_queries(url), self.QUERY_BUDGET[name]
+                )
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = self.urls(self.create_rows(1))
+        small = {name: self.count_queries(url) for name, url in urls.items()}
+        urls = self.urls(self.create_rows(10))
+        for name, url in urls.items():
+            with self.subTest(name=name):
+                self.assertEqual(self.count_queries(url), small[name])
+
+    def test_changelist_estimates_large_tables(self):
+        self.create_rows(3)
+        last_pk = Post.objects.order_by("pk").last().pk
+        with mock.patch.object(EstimatedCountPaginator, "exact_limit", 1):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client_admin.get(
+                    reverse("admin:posts_post_changelist")
+                )
+
+        self.assertEqual(response.context["cl"].result_count, last_pk)
+        counts = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('SELECT COUNT(*) AS "__count" FROM')
+            and '"posts_post"' in query["sql"]
+        ]
+        self.assertEqual(counts, [])
+
+
+class GroupCatalogTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title="test_title", slug="test_slug", description="test_desc"
+        )
+
+    def setUp(self):
+        cache.clear()
+        # Откат транзакции теста каталог не видит
+        group_catalog.invalidate()
+        group_catalog.all()
+
+    def test_lookups_and_form_choices_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                group_catalog.get_by_slug(self.group.slug), self.group
+            )
+            self.assertEqual(group_catalog.get(self.group.pk), self.group)
+            self.assertIn("test_title", str(PostForm()["group"]))
+
+    def test_invalidated_on_save_and_delete(self):
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = "new_title"
+        group.save()
+        self.assertEqual(group_catalog.get(group.pk).title, "new_title")
+
+        group.delete()
+        self.assertIsNone(group_catalog.get_by_slug("test_slug"))
+
+    def test_change_in_other_process_is_picked_up(self):
+        # Другой процесс меняет группу и поднимает поколение каталога
+        Group.objects.filter(pk=self.group.pk).update(slug="moved")
+        bump_generations(CATALOG_SCOPE)
+
+        with mock.patch.object(group_catalog, "check_interval", 0):
+            self.assertIsNone(group_catalog.get_by_slug("test_slug"))
+            self.assertEqual(group_catalog.get_by_slug("moved"), self.group)
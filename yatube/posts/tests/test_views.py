@@ -1,14 +1,39 @@
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
+from core.thumbnail_engine import Engine
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from posts.cache import (
+    GLOBAL_SCOPE,
+    _is_cacheable,
+    author_scope,
+    bump_generations,
+    get_generations,
+)
+from posts.likes import (
+    CACHE_ALIAS,
+    FLUSH_DUE_KEY,
+    SLOT_KEY,
+    TAIL_KEY,
+    flush_like_counts,
+    pending_like_deltas,
+    record_like,
+    set_like,
+    toggle_like,
+)
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.thumbnails import WEBP, generate_thumbnails
+from posts.utils import CursorPaginator
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
@@ -192,6 +217,9 @@ class PostsPaginatorTest(TestCase):
             "posts:profile", kwargs={"username": cls.user.username}
         )
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_10(self):
         urls = {
             "index": self.INDEX_URL,
@@ -207,22 +235,75 @@ class PostsPaginatorTest(TestCase):
                 )
 
     def test_second_page_posts(self):
-        names_urls = {
-            "index": self.INDEX_URL + "?page=2",
-            "group_list": self.GROUP_URL + "?page=2",
-            "profile": self.PROFILE_URL + "?page=2",
+        urls = {
+            "index": self.INDEX_URL,
+            "group_list": self.GROUP_URL,
+            "profile": self.PROFILE_URL,
         }
 
         posts_on_n_page = Post.objects.count() % settings.PAGE_NUMBER_CONST
 
-        for name, url in names_urls.items():
+        for name, url in urls.items():
             with self.subTest(name=name):
+                cache.clear()
                 response = self.authorized_client.get(url)
-                self.assertEqual(
-                    len(response.context.get("page_obj").object_list),
-                    posts_on_n_page,
+                first_page = response.context["page_obj"]
+                self.assertTrue(first_page.has_next())
+                response = self.authorized_client.get(
+                    url, {"after": first_page.paginator.next_cursor}
+                )
+                page_obj = response.context.get("page_obj")
+                self.assertEqual(len(page_obj.object_list), posts_on_n_page)
+                self.assertFalse(page_obj.has_next())
+                self.assertTrue(page_obj.has_previous())
+                self.assertTrue(
+                    set(page_obj).isdisjoint(first_page.object_list)
                 )
 
+    def test_previous_page_returns_first_page(self):
+        first_page = self.authorized_client.get(self.PROFILE_URL).context[
+            "page_obj"
+        ]
+        second_page = self.authorized_client.get(
+            self.PROFILE_URL, {"after": first_page.paginator.next_cursor}
+        ).context["page_obj"]
+        response = self.authorized_client.get(
+            self.PROFILE_URL, {"before": second_page.paginator.previous_cursor}
+        )
+        page_obj = response.context["page_obj"]
+        self.assertEqual(page_obj.object_list, first_page.object_list)
+        self.assertFalse(page_obj.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.authorized_client.get(
+            self.PROFILE_URL, {"after": "not-a-cursor"}
+        )
+        self.assertEqual(
+            len(response.context["page_obj"]), settings.PAGE_NUMBER_CONST
+        )
+
+    def test_deep_cursor_seeks_index(self):
+        post = Post.objects.order_by("pub_date", "id")[2]
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        queryset = Post.objects.filter(
+            paginator._boundary((post.pub_date, post.pk), "lt")
+        ).order_by("-pub_date", "-id")
+
+        plan = queryset.explain()
+        self.assertIn("post_pub_date_idx (pub_date<?)", plan)
+        self.assertEqual(
+            list(queryset),
+            list(Post.objects.order_by("-pub_date", "-id"))[-2:],
+        )
+
+    @override_settings(PAGINATION_MODE="page")
+    def test_page_number_mode(self):
+        response = self.authorized_client.get(self.PROFILE_URL, {"page": 2})
+        self.assertEqual(
+            len(response.context["page_obj"]),
+            Post.objects.count() % settings.PAGE_NUMBER_CONST,
+        )
+
 
 class PostCacheTest(TestCase):
     @classmethod
@@ -238,20 +319,59 @@ class PostCacheTest(TestCase):
             author=cls.user,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def test_cache(self):
         response = self.authorized_client.get(reverse("posts:index"))
 
-        self.post.delete()
+        Post.objects.filter(pk=self.post.pk).update(text="changed_text")
 
-        response_after_delete = self.client.get(reverse("posts:index"))
-        self.assertEqual(response.content, response_after_delete.content)
+        response_after_update = self.authorized_client.get(
+            reverse("posts:index")
+        )
+        self.assertEqual(response.content, response_after_update.content)
 
         cache.clear()
 
-        response_after_cache_clear = self.client.get(reverse("posts:index"))
+        response_after_cache_clear = self.authorized_client.get(
+            reverse("posts:index")
+        )
         self.assertNotEqual(
-            response_after_delete.content, response_after_cache_clear.content
+            response_after_update.content, response_after_cache_clear.content
+        )
+
+    def test_cache_invalidated_on_delete(self):
+        response = self.authorized_client.get(reverse("posts:index"))
+
+        self.post.delete()
+
+        response_after_delete = self.authorized_client.get(
+            reverse("posts:index")
         )
+        self.assertNotEqual(response.content, response_after_delete.content)
+
+    @override_settings(DATABASE_REPLICAS=["replica"])
+    def test_replica_page_not_cached_right_after_its_change(self):
+        bump_generations(author_scope("other"))
+        with mock.patch(
+            "posts.cache.request_read_replica", return_value=True
+        ):
+            self.assertTrue(_is_cacheable(HttpResponse(), [GLOBAL_SCOPE]))
+            bump_generations(GLOBAL_SCOPE)
+            self.assertFalse(_is_cacheable(HttpResponse(), [GLOBAL_SCOPE]))
+
+    def test_cache_invalidated_on_comment(self):
+        url = reverse("posts:profile", args=(self.user.username,))
+        response = self.authorized_client.get(url)
+
+        self.authorized_client.post(
+            reverse("posts:add_comment", args=(self.post.pk,)),
+            data={"text": "comment"},
+        )
+
+        response_after_comment = self.authorized_client.get(url)
+        self.assertNotEqual(response.content, response_after_comment.content)
 
 
 class PostFollowTest(TestCase):
@@ -327,3 +447,380 @@ class PostFollowTest(TestCase):
         response = self.authorized_client_random.get(reverse("posts:follow_index"))
 
         self.assertNotIn(post, response.context["page_obj"])
+
+    def test_follow_backfills_timeline(self):
+        self.authorized_client_follower.get(
+            reverse(
+                "posts:profile_follow", args=(self.user_following.username,)
+            )
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user_follower, post=self.post
+            ).exists()
+        )
+
+    def test_unfollow_clears_timeline(self):
+        Follow.objects.create(
+            user=self.user_follower,
+            author=self.user_following,
+        )
+        self.authorized_client_follower.get(
+            reverse(
+                "posts:profile_unfollow", args=(self.user_following.username,)
+            )
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user_follower).exists()
+        )
+
+    def test_deleted_post_leaves_timeline(self):
+        Follow.objects.create(
+            user=self.user_follower,
+            author=self.user_following,
+        )
+        post = Post.objects.create(
+            author=self.user_following, text="test_text"
+        )
+        self.authorized_client_following.get(
+            reverse("posts:post_delete", args=(post.pk,))
+        )
+        response = self.authorized_client_follower.get(
+            reverse("posts:follow_index")
+        )
+        self.assertNotIn(post, response.context["page_obj"])
+        self.assertFalse(
+            TimelineEntry.objects.filter(post_id=post.pk).exists()
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
+class PostThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="author")
+        small_gif = (
+            b"\x47\x49\x46\x38\x39\x61\x02\x00"
+            b"\x01\x00\x80\x00\x00\x00\x00\x00"
+            b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+            b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+            b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+            b"\x0A\x00\x3B"
+        )
+        cls.post = Post.objects.create(
+            text="test_text",
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name="thumb.gif", content=small_gif, content_type="image/gif"
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_original_served_until_thumbnail_ready(self):
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, self.post.image.url)
+        self.assertContains(response, 'width="2" height="1"')
+
+        generate_thumbnails(self.post.image.name)
+        response = self.client.get(reverse("posts:index"))
+        self.assertNotContains(response, self.post.image.url)
+        self.assertContains(response, settings.MEDIA_URL + "cache/")
+        self.assertContains(response, "srcset=")
+
+    def test_webp_variants_offered_as_source(self):
+        get_raw_data = Engine._get_raw_data
+
+        def encode(engine, image, format_, *args, **kwargs):
+            # Pillow здесь может быть собран без WebP: кодируем в PNG
+            if format_ == WEBP:
+                format_ = "PNG"
+            return get_raw_data(engine, image, format_, *args, **kwargs)
+
+        with mock.patch(
+            "posts.thumbnails.variant_formats", return_value=(WEBP, None)
+        ), mock.patch.object(
+            Engine, "_get_raw_data", autospec=True, side_effect=encode
+        ):
+            generate_thumbnails(self.post.image.name)
+            response = self.client.get(reverse("posts:index"))
+
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, ".webp 320w")
+        self.assertContains(response, ".gif 320w")
+
+    def test_missing_original_does_not_reset_page_cache(self):
+        Post.objects.create(
+            text="broken", author=self.user, image="posts/missing.gif"
+        )
+        generations = get_generations([GLOBAL_SCOPE])
+
+        self.assertEqual(generate_thumbnails("posts/missing.gif"), 0)
+        self.assertEqual(get_generations([GLOBAL_SCOPE]), generations)
+
+        with mock.patch("posts.thumbnails.schedule_thumbnails") as schedule:
+            response = self.client.get(reverse("posts:index"))
+        self.assertEqual(response.status_code, 200)
+        scheduled = [call.args[0].name for call in schedule.call_args_list]
+        self.assertNotIn("posts/missing.gif", scheduled)
+
+
+@override_settings(PAGE_NUMBER_CONST=2)
+class PostSearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="author", is_staff=True)
+        cls.user.is_superuser = True
+        cls.user.save()
+        cls.best = Post.objects.create(
+            author=cls.user, text="Кофе, кофе и снова кофе"
+        )
+        cls.good = Post.objects.create(
+            author=cls.user, text="Утренний кофе у реки, потом долгая дорога"
+        )
+        cls.other = Post.objects.create(author=cls.user, text="Чай")
+        cls.prefix = Post.objects.create(
+            author=cls.user, text="Кофточка на распродаже"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse("posts:search"), {"q": query, **params}
+        )
+
+    def test_results_ranked_by_relevance(self):
+        response = self.search("кофе")
+
+        self.assertEqual(
+            list(response.context["page_obj"]),
+            [self.best, self.good],
+        )
+
+    def test_keyset_pagination(self):
+        first = self.search("коф")
+        page_obj = first.context["page_obj"]
+        self.assertTrue(page_obj.has_next())
+
+        second = self.search(
+            "коф", after=page_obj.paginator.next_cursor
+        ).context["page_obj"]
+
+        found = list(page_obj) + list(second)
+        self.assertCountEqual(found, [self.best, self.good, self.prefix])
+        self.assertFalse(second.has_next())
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.text = "Крепкий кофе"
+        self.other.save()
+        Post.objects.filter(pk=self.best.pk).delete()
+
+        response = self.search("кофе")
+
+        self.assertIn(self.other, response.context["page_obj"])
+        self.assertNotIn(self.best, response.context["page_obj"])
+
+    def test_query_operators_are_escaped(self):
+        response = self.search('кофе OR "чай NEAR(')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["page_obj"]), [])
+
+    def test_empty_query(self):
+        response = self.search("  ")
+
+        self.assertIsNone(response.context["page_obj"])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(
+            reverse("admin:posts_post_changelist"), {"q": "кофточка"}
+        )
+
+        self.assertEqual(
+            list(response.context["cl"].result_list), [self.prefix]
+        )
+
+
+class PostLikeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.post = Post.objects.create(author=cls.author, text="text")
+
+    def setUp(self):
+        cache.clear()
+        self.likes_cache = caches[CACHE_ALIAS]
+        self.likes_cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.url = reverse("posts:likes", args=(self.post.pk,))
+
+    def like(self, **data):
+        return self.client.post(
+            self.url, data, HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        )
+
+    def test_ajax_toggle_returns_state_and_count(self):
+        self.assertEqual(self.like().json(), {"liked": True, "count": 1})
+        self.assertEqual(self.like().json(), {"liked": False, "count": 0})
+        self.assertFalse(self.post.likes.exists())
+
+    def test_explicit_state_is_idempotent(self):
+        self.like(liked="1")
+        response = self.like(liked="1")
+
+        self.assertEqual(response.json(), {"liked": True, "count": 1})
+        self.assertEqual(self.post.likes.count(), 1)
+
+    def test_counts_are_written_behind(self):
+        self.likes_cache.add(FLUSH_DUE_KEY, 1, None)
+        other = Client()
+        other.force_login(self.author)
+        self.like()
+        other.post(self.url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 0)
+        response = self.client.get(
+            reverse("posts:post_detail", args=(self.post.pk,))
+        )
+        self.assertEqual(response.context["likes_count"], 2)
+
+        call_command("flush_like_counts", stdout=StringIO())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 2)
+        self.assertEqual(
+            pending_like_deltas([self.post.pk]), {self.post.pk: 0}
+        )
+
+    def test_toggle_after_racing_insert_changes_nothing(self):
+        # Параллельный запрос поставил лайк между DELETE и INSERT этого
+        self.post.likes.add(self.reader)
+
+        def delete_missed(post_id, user_id, liked):
+            return liked and set_like(post_id, user_id, liked)
+
+        with mock.patch("posts.likes.set_like", side_effect=delete_missed):
+            state = toggle_like(self.post.pk, self.reader.pk)
+
+        self.assertEqual(state, (True, False))
+
+    def test_flush_waits_for_slot_being_written(self):
+        # Другой процесс занял ячейку 1, но ещё не записал в неё пост
+        self.likes_cache.set(TAIL_KEY, 1, None)
+        record_like(self.post.pk, True)
+
+        self.assertEqual(flush_like_counts(), 0)
+        self.likes_cache.set(SLOT_KEY.format(1), self.post.pk, None)
+        self.assertEqual(flush_like_counts(), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 1)
+
+    def test_flush_skips_slot_of_crashed_writer(self):
+        self.likes_cache.set(TAIL_KEY, 1, None)
+        record_like(self.post.pk, True)
+
+        self.assertEqual(flush_like_counts(), 0)
+        self.assertEqual(flush_like_counts(), 1)
+
+    def test_toggle_query_count(self):
+        self.likes_cache.add(FLUSH_DUE_KEY, 1, None)
+        self.like(liked="1")
+        # сессия, пользователь, пост и одна запись в таблицу лайков
+        with self.assertNumQueries(4):
+            self.like(liked="0")
+
+    def test_feed_shows_like_state_after_toggle(self):
+        index = reverse("posts:index")
+        self.assertContains(self.client.get(index), 'data-liked="0"')
+
+        self.like()
+
+        response = self.client.get(index)
+        self.assertContains(response, 'data-liked="1"')
+        self.assertContains(response, "1 Like</span>")
+
+    def test_form_post_without_javascript(self):
+        response = self.client.post(self.url)
+
+        self.assertRedirects(
+            response, reverse("posts:post_detail", args=(self.post.pk,))
+        )
+        self.assertTrue(self.post.likes.filter(pk=self.reader.pk).exists())
+
+
+@override_settings(COMMENTS_PAGE_SIZE=20)
+class PostCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.post = Post.objects.create(author=cls.author, text="text")
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f"comment {i}")
+            for i in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.detail_url = reverse("posts:post_detail", args=(self.post.pk,))
+        self.fragment_url = reverse(
+            "posts:post_comments", args=(self.post.pk,)
+        )
+
+    def test_detail_shows_first_batch_newest_first(self):
+        response = self.client.get(self.detail_url)
+        comments = response.context["comments"]
+
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, "comment 24")
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, "data-fragment-url")
+
+    def test_fragment_returns_next_batch_only(self):
+        cursor = self.client.get(self.detail_url).context[
+            "comments"
+        ].paginator.next_cursor
+
+        response = self.client.get(self.fragment_url, {"after": cursor})
+
+        self.assertEqual(
+            [comment.text for comment in response.context["comments"]],
+            [f"comment {i}" for i in range(4, -1, -1)],
+        )
+        self.assertNotContains(response, "<html")
+        self.assertNotContains(response, "Показать ещё")
+
+    def test_fragment_query_count(self):
+        cursor = self.client.get(self.detail_url).context[
+            "comments"
+        ].paginator.next_cursor
+        # комментарии вместе с авторами — одним запросом
+        with self.assertNumQueries(1):
+            self.client.get(self.fragment_url, {"after": cursor})
+
+    def test_fragment_with_broken_cursor_starts_over(self):
+        response = self.client.get(self.fragment_url, {"after": "broken"})
+
+        self.assertEqual(len(response.context["comments"]), 20)
+
+    def test_detail_pages_without_javascript(self):
+        cursor = self.client.get(self.detail_url).context[
+            "comments"
+        ].paginator.next_cursor
+
+        response = self.client.get(self.detail_url, {"comments_after": cursor})
+
+        self.assertEqual(len(response.context["comments"]), 5)
@@ -0,0 +1,298 @@
+"""Фоновая подготовка миниатюр для картинок постов."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .cache import bump_generations, post_scopes
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Все геометрии, которые используют шаблоны лент и страницы поста
+FEED_THUMBNAIL_OPTIONS = {"crop": "center", "upscale": True}
+FEED_GEOMETRIES = ("960x450", "960x339")
+# Ширины для srcset; шире базовой геометрии картинку не растягиваем
+RESPONSIVE_WIDTHS = (320, 640, 960, 1920)
+UPSCALE_WIDTH = 960
+WEBP = "WEBP"
+# Картинку, для которой не удалось построить варианты, шаблоны какое-то
+# время не заказывают заново
+FAILED_KEY = "thumbnails:failed:{}"
+FAILED_TIMEOUT = 60 * 60
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix="thumbnails"
+)
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+
+def variant_formats():
+    """WebP, если Pillow его умеет, и формат оригинала (None) как запасной."""
+    if features.check("webp"):
+        return (WEBP, None)
+    return (None,)
+
+
+def variant_geometries(geometry):
+    """Геометрии всех ширин srcset с пропорциями базовой ``geometry``."""
+    width, height = map(int, geometry.split("x"))
+    return [
+        f"{size}x{round(size * height / width)}"
+        for size in RESPONSIVE_WIDTHS
+    ]
+
+
+def variant_options(geometry, format_=None):
+    options = dict(FEED_THUMBNAIL_OPTIONS)
+    if int(geometry.split("x")[0]) > UPSCALE_WIDTH:
+        options["upscale"] = False
+    if format_:
+        options["format"] = format_
+    return options
+
+
+def thumbnail_name(file_, geometry, **options):
+    """Имя файла миниатюры так, как его посчитает ``get_thumbnail``."""
+    backend = default.backend
+    source = ImageFile(file_)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, geometry, options)
+
+
+def get_ready_thumbnails(requests):
+    """Готовые миниатюры без рендера: ``{запрос: миниатюра или None}``.
+
+    Запрос — кортеж ``(имя картинки, геометрия, формат)``. Для хранилища
+    sorl по умолчанию (кэш + БД) все ключи читаются одним ``get_many``, а
+    промахи добираются одним запросом к БД.
+    """
+    names = {
+        (name, geometry, format_): thumbnail_name(
+            name, geometry, **variant_options(geometry, format_)
+        )
+        for name, geometry, format_ in requests
+    }
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        return {
+            request: kvstore.get(ImageFile(name, default.storage))
+            for request, name in names.items()
+        }
+    keys = {
+        request: add_prefix(ImageFile(name, default.storage).key)
+        for request, name in names.items()
+    }
+    values = kvstore.cache.get_many(set(keys.values()))
+    missing = set(keys.values()) - set(values)
+    if missing:
+        found = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                "key", "value"
+            )
+        )
+        fetched = {
+            key: found.get(key, cached_db_kvstore.EMPTY_VALUE)
+            for key in missing
+        }
+        kvstore.cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        request: None
+        if values[key] == cached_db_kvstore.EMPTY_VALUE
+        else deserialize_image_file(values[key])
+        for request, key in keys.items()
+    }
+
+
+def _variant_requests(name):
+    return [
+        (name, variant, format_)
+        for geometry in FEED_GEOMETRIES
+        for variant in variant_geometries(geometry)
+        for format_ in variant_formats()
+    ]
+
+
+def _failed_names(names):
+    keys = {FAILED_KEY.format(name): name for name in names}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+def generate_thumbnails(name):
+    """Рендерит недостающие варианты картинки и сбрасывает кэш страниц с ней.
+
+    Возвращает число записанных вариантов. Если какой-то вариант не
+    получился — например, файла оригинала нет, — картинка на
+    ``FAILED_TIMEOUT`` секунд перестаёт заказываться из шаблонов, а кэш
+    страниц без новых вариантов не сбрасывается.
+    """
+    written = missing = 0
+    failed = True
+    try:
+        ready = get_ready_thumbnails(_variant_requests(name))
+        for (_, variant, format_), thumbnail in ready.items():
+            if thumbnail is not None:
+                continue
+            missing += 1
+            # При ошибке sorl пишет её в лог и отдаёт несозданный файл
+            thumbnail = get_thumbnail(
+                name, variant, **variant_options(variant, format_)
+            )
+            if thumbnail.exists():
+                written += 1
+        failed = written < missing
+        if written:
+            posts = Post.objects.filter(image=name).select_related(
+                "author", "group"
+            )
+            for post in posts:
+                bump_generations(*post_scopes(post))
+    except Exception:
+        logger.exception("Не удалось подготовить миниатюры для %s", name)
+    finally:
+        # Метку ставим до снятия из очереди, чтобы шаблон не успел
+        # заказать картинку ещё раз
+        if failed:
+            cache.set(FAILED_KEY.format(name), 1, FAILED_TIMEOUT)
+        else:
+            cache.delete(FAILED_KEY.format(name))
+        with _scheduled_lock:
+            _scheduled.discard(name)
+    return written
+
+
+def delete_thumbnails(name):
+    """Удаляет файлы миниатюр картинки и её записи в хранилище sorl.
+
+    Ключи sorl строит по своему хранилищу по умолчанию, как в
+    ``get_thumbnail``, а не по хранилищу поля ``image``.
+    """
+    default.kvstore.delete(ImageFile(name, default.storage))
+
+
+def _generate_in_background(name):
+    try:
+        generate_thumbnails(name)
+    finally:
+        connections.close_all()
+
+
+def _submit(name):
+    with _scheduled_lock:
+        if name in _scheduled:
+            return
+        _scheduled.add(name)
+    if settings.THUMBNAIL_ASYNC:
+        _executor.submit(_generate_in_background, name)
+    else:
+        generate_thumbnails(name)
+
+
+def schedule_thumbnails(image):
+    """Ставит в очередь все миниатюры картинки после коммита транзакции."""
+    if image:
+        name = image.name
+        transaction.on_commit(lambda: _submit(name))
+
+
+class ResponsiveImage:
+    """Готовые варианты картинки для ``<picture>``.
+
+    ``src`` — базовая миниатюра в формате оригинала, а пока её нет — сам
+    оригинал; ``width`` и ``height`` — размеры ``src``. В ``srcset`` и
+    ``webp_srcset`` попадают только готовые варианты.
+    """
+
+    def __init__(self, src, width, height, srcset="", webp_srcset=""):
+        self.src = src
+        self.width = width
+        self.height = height
+        self.srcset = srcset
+        self.webp_srcset = webp_srcset
+
+    @property
+    def url(self):
+        return self.src
+
+
+def _srcset(thumbnails):
+    urls = {}
+    for thumbnail in thumbnails:
+        if thumbnail is not None:
+            urls.setdefault(thumbnail.width, thumbnail.url)
+    return ", ".join(f"{url} {width}w" for width, url in sorted(urls.items()))
+
+
+def get_responsive_images(posts, geometry):
+    """Варианты картинок постов за одно обращение к хранилищу sorl.
+
+    Возвращает ``{pk поста: ResponsiveImage}``; файлы оригиналов не
+    открываются. Картинки, у которых готовы не все варианты, заказываются
+    в фоне.
+    """
+    posts = [post for post in posts if post.image]
+    variants = variant_geometries(geometry)
+    ready = get_ready_thumbnails(
+        {
+            (post.image.name, variant, format_)
+            for post in posts
+            for variant in variants
+            for format_ in variant_formats()
+        }
+    )
+    incomplete = {
+        name for (name, _, _), thumbnail in ready.items() if thumbnail is None
+    }
+    if incomplete:
+        incomplete -= _failed_names(incomplete)
+    pictures = {}
+    for post in posts:
+        name = post.image.name
+        if name in incomplete:
+            schedule_thumbnails(post.image)
+        base = ready[name, geometry, None]
+        if base is not None:
+            src, width, height = base.url, base.width, base.height
+        else:
+            src, width, height = (
+                post.image.url,
+                post.image_width,
+                post.image_height,
+            )
+        pictures[post.pk] = ResponsiveImage(
+            src,
+            width,
+            height,
+            srcset=_srcset(ready[name, variant, None] for variant in variants),
+            webp_srcset=_srcset(
+                ready.get((name, variant, WEBP)) for variant in variants
+            ),
+        )
+    return pictures
+
+
+def attach_pictures(posts, geometry):
+    """Проставляет постам ``picture``: ResponsiveImage или None."""
+    pictures = get_responsive_images(posts, geometry)
+    for post in posts:
+        post.picture = pictures.get(post.pk)
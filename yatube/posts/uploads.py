@@ -0,0 +1,53 @@
+"""Запись картинок, которые клиент загружает кусками."""
+import os
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from PIL import Image
+
+from .models import ImageUpload
+
+READ_SIZE = 64 * 1024
+# Сколько байт должно прийти, чтобы проверить заголовок картинки
+HEADER_SIZE = 16 * 1024
+
+
+def write_chunk(upload, offset, stream, length):
+    """Пишет кусок с позиции ``offset`` и возвращает новый ``received``.
+
+    Данные читаются из ``stream`` порциями по ``READ_SIZE`` и сразу идут в
+    файл, поэтому память не зависит от размера куска. Повторная отправка
+    уже принятого куска безопасна: он ляжет на то же место.
+    """
+    os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+    fd = os.open(upload.path, os.O_WRONLY | os.O_CREAT, 0o600)
+    written = 0
+    with os.fdopen(fd, "wb") as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+    ImageUpload.objects.filter(pk=upload.pk, received__gte=offset).update(
+        received=Greatest(F("received"), offset + written)
+    )
+    upload.refresh_from_db(fields=["received"])
+    return upload.received
+
+
+def needs_header_check(upload, offset):
+    """Заголовок проверяется, как только его байты впервые пришли целиком."""
+    return offset < HEADER_SIZE and (
+        upload.received >= HEADER_SIZE or upload.complete
+    )
+
+
+def has_image_header(upload):
+    """Pillow разбирает только заголовок, не декодируя картинку."""
+    try:
+        with Image.open(upload.path) as image:
+            return image.format is not None
+    except (OSError, SyntaxError, ValueError):
+        return False
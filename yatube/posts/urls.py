@@ -15,11 +15,17 @@ urlpatterns = [
     path(
         "posts/<int:post_id>/comment/", views.add_comment, name="add_comment"
     ),
+    path(
+        "posts/<int:post_id>/comments/",
+        views.post_comments,
+        name="post_comments",
+    ),
     path(
         "comment/<int:comment_id>/",
         views.delete_comment,
         name="delete_comment",
     ),
+    path("search/", views.post_search, name="search"),
     path("follow/", views.follow_index, name="follow_index"),
     path(
         "profile/<str:username>/follow/",
@@ -32,4 +38,8 @@ urlpatterns = [
         name="profile_unfollow",
     ),
     path("like/<int:post_id>/", views.post_like, name="likes"),
+    path("uploads/", views.upload_start, name="upload_start"),
+    path(
+        "uploads/<uuid:upload_id>/", views.upload_chunk, name="upload_chunk"
+    ),
 ]
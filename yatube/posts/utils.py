@@ -1,9 +1,148 @@
+import base64
+import binascii
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+CURSOR_MODE = "cursor"
+PAGE_MODE = "page"
+
+
+def encode_cursor(pub_date, pk):
+    raw = f"{pub_date.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, pk) или None для битого токена."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit("|", 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинатор по (pub_date, id) без COUNT(*) и OFFSET.
+
+    Общее число страниц не известно, поэтому ``num_pages`` описывает только
+    соседей текущей страницы: этого хватает ``Page.has_next`` и
+    ``Page.has_previous``. Токены соседних страниц лежат в ``next_cursor``
+    и ``previous_cursor``.
+    """
+
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, key=("pub_date", "id")):
+        super().__init__(object_list, per_page)
+        self.key = key
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._number = 1
+        self._has_next = False
+
+    @property
+    def num_pages(self):
+        return self._number + int(self._has_next)
+
+    def _boundary(self, cursor, lookup):
+        date_field, pk_field = self.key
+        pub_date, pk = cursor
+        # Без отдельной границы по дате SQLite не видит диапазона в OR и
+        # сканирует индекс с начала: глубокие страницы стоили бы O(глубины)
+        return Q(**{f"{date_field}__{lookup}e": pub_date}) & (
+            Q(**{f"{date_field}__{lookup}": pub_date})
+            | Q(**{date_field: pub_date, f"{pk_field}__{lookup}": pk})
+        )
+
+    def _cursor_for(self, obj):
+        date_field, pk_field = self.key
+        return encode_cursor(getattr(obj, date_field), getattr(obj, pk_field))
+
+    def get_cursor_page(self, after=None, before=None, restart=True):
+        """Страница после ``after`` или перед ``before``.
+
+        Если за курсором ничего нет, при ``restart`` отдаётся первая
+        страница, иначе — пустая.
+        """
+        date_field, pk_field = self.key
+        after = decode_cursor(after)
+        before = decode_cursor(before) if after is None else None
+        queryset = self.object_list
+        limit = self.per_page + 1
+
+        if before is not None:
+            rows = list(
+                queryset.filter(self._boundary(before, "gt")).order_by(
+                    date_field, pk_field
+                )[:limit]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[: self.per_page][::-1]
+            has_next = True
+        else:
+            if after is not None:
+                queryset = queryset.filter(self._boundary(after, "lt"))
+            rows = list(
+                queryset.order_by(f"-{date_field}", f"-{pk_field}")[:limit]
+            )
+            has_next = len(rows) > self.per_page
+            rows = rows[: self.per_page]
+            has_previous = after is not None
+
+        if not rows and (after or before) and restart:
+            return self.get_cursor_page()
+
+        self._number = 2 if has_previous else 1
+        self._has_next = has_next and bool(rows)
+        if rows:
+            if self._has_next:
+                self.next_cursor = self._cursor_for(rows[-1])
+            if has_previous:
+                self.previous_cursor = self._cursor_for(rows[0])
+        return Page(rows, self._number, self)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки без точного ``COUNT(*)`` по большой таблице.
+
+    Без фильтров число строк оценивается по наибольшему id — это один
+    проход по индексу первичного ключа; точный ``COUNT(*)`` выполняется
+    только если оценка не больше ``exact_limit``; после удалений последние
+    страницы оценки могут оказаться пустыми. С фильтрами строки считаются
+    не дальше ``exact_limit + 1``.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            estimate = queryset.aggregate(last=Max("pk"))["last"] or 0
+            if estimate > self.exact_limit:
+                return estimate
+            return queryset.count()
+        return queryset[: self.exact_limit + 1].count()
 
 
-def paginator_func(post_list, request):
-    paginator = Paginator(post_list, settings.PAGE_NUMBER_CONST)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+def paginator_func(post_list, request, key=("pub_date", "id")):
+    if settings.PAGINATION_MODE == PAGE_MODE:
+        paginator = Paginator(post_list, settings.PAGE_NUMBER_CONST)
+        page_number = request.GET.get("page")
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(post_list, settings.PAGE_NUMBER_CONST, key)
+    return paginator.get_cursor_page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
@@ -1,44 +1,93 @@
+from contextlib import closing
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_http_methods, require_POST
 
+from .cache import (
+    GLOBAL_SCOPE,
+    author_scope,
+    bump_generations,
+    cache_feed,
+    group_scope,
+    user_scope,
+)
+from .catalog import attach_groups, group_catalog
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
-from .utils import paginator_func
+from .likes import (
+    attach_likes,
+    flush_if_due,
+    like_count,
+    record_like,
+    set_like,
+    toggle_like,
+)
+from .models import (
+    AuthorStats,
+    Comment,
+    Follow,
+    ImageUpload,
+    Post,
+    User,
+)
+from .search import SearchPaginator, build_match, is_available
+from .thumbnails import schedule_thumbnails
+from .uploads import has_image_header, needs_header_check, write_chunk
+from .utils import CursorPaginator, paginator_func
 
 
-@cache_page(5, key_prefix="index_page")
+@cache_feed(GLOBAL_SCOPE)
 def index(request):
     template = "posts/index.html"
-    post_list = Post.objects.all()
-    context = {"page_obj": paginator_func(post_list, request)}
+    post_list = Post.objects.for_feed()
+    page_obj = paginator_func(post_list, request)
+    attach_groups(page_obj)
+    attach_likes(page_obj, request.user)
+    context = {"page_obj": page_obj}
     return render(request, template, context)
 
 
+@cache_feed(group_scope("{slug}"))
 def group_posts(request, slug):
     template = "posts/group_list.html"
-    group = get_object_or_404(Group, slug=slug)
-    group_post_list = group.posts.all()
+    group = group_catalog.get_by_slug(slug)
+    if group is None:
+        raise Http404("Нет такой группы")
+    group_post_list = group.posts.for_feed()
+    page_obj = paginator_func(group_post_list, request)
+    attach_groups(page_obj)
+    attach_likes(page_obj, request.user)
     context = {
         "group": group,
-        "page_obj": paginator_func(group_post_list, request),
+        "page_obj": page_obj,
     }
     return render(request, template, context)
 
 
+@cache_feed(author_scope("{username}"))
 def profile(request, username):
     template = "posts/profile.html"
-    author = get_object_or_404(User, username=username)
-    author_post = author.posts.all()
-    posts_count = author_post.count()
+    author = get_object_or_404(
+        User.objects.select_related("stats"), username=username
+    )
+    author_post = author.posts.for_feed()
+    stats = AuthorStats.objects.get_for(author)
     following = (
         request.user.is_authenticated
         and Follow.objects.filter(user=request.user, author=author).exists()
     )
+    page_obj = paginator_func(author_post, request)
+    attach_groups(page_obj)
+    attach_likes(page_obj, request.user)
     context = {
-        "page_obj": paginator_func(author_post, request),
+        "page_obj": page_obj,
         "author": author,
-        "posts_count": posts_count,
+        "posts_count": stats.post_count,
+        "stats": stats,
         "following": following,
     }
     return render(request, template, context)
@@ -46,23 +95,47 @@ def profile(request, username):
 
 def post_detail(request, post_id):
     template = "posts/post_detail.html"
-    post = get_object_or_404(Post, pk=post_id)
-    posts_count = post.author.posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related("author__stats"), pk=post_id
+    )
+    attach_groups([post])
+    attach_likes([post], request.user)
+    posts_count = AuthorStats.objects.get_for(post.author).post_count
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
-
-    liked = False
-
-    if post.likes.filter(id=request.user.id).exists():
-        liked = True
+    comments = _comments_page(post.pk, request.GET.get("comments_after"))
 
     context = {
         "post": post,
         "posts_count": posts_count,
         "form": form,
         "comments": comments,
-        "likes_count": post.likes_count(),
-        "post_is_liked": liked,
+        "likes_count": post.like_total,
+        "post_is_liked": post.is_liked,
+    }
+    return render(request, template, context)
+
+
+def _comments_page(post_id, after=None, restart=True):
+    """Пачка комментариев от новых к старым по ключу ``(created, id)``."""
+    comments = (
+        Comment.objects.filter(post_id=post_id)
+        .with_authors()
+        .order_by("-created", "-id")
+    )
+    paginator = CursorPaginator(
+        comments, settings.COMMENTS_PAGE_SIZE, key=("created", "id")
+    )
+    return paginator.get_cursor_page(after=after, restart=restart)
+
+
+def post_comments(request, post_id):
+    """Следующая пачка комментариев для кнопки «Показать ещё»."""
+    template = "posts/includes/comment_list.html"
+    context = {
+        "post_id": post_id,
+        "comments": _comments_page(
+            post_id, request.GET.get("after"), restart=False
+        ),
     }
     return render(request, template, context)
 
@@ -70,11 +143,22 @@ def post_detail(request, post_id):
 @login_required
 def post_create(request):
     template = "posts/create_post.html"
-    form = PostForm(request.POST or None, files=request.FILES or None)
-    if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+    upload = ImageUpload.objects.completed_for(
+        request.user, request.POST.get("upload")
+    )
+    form = PostForm(
+        request.POST or None, files=request.FILES or None, upload=upload
+    )
+    with closing(form):
+        is_valid = form.is_valid()
+        if is_valid:
+            post = form.save(commit=False)
+            post.author = request.user
+            post.save()
+    if is_valid:
+        if upload is not None:
+            upload.discard()
+        schedule_thumbnails(post.image)
         return redirect("posts:profile", username=post.author)
     context = {
         "form": form,
@@ -87,13 +171,26 @@ def post_create(request):
 def post_edit(request, post_id):
     template = "posts/create_post.html"
     post = get_object_or_404(Post, pk=post_id)
-    form = PostForm(
-        request.POST or None, files=request.FILES or None, instance=post
-    )
     if request.user != post.author:
         return redirect("posts:post_detail", post.pk)
-    if form.is_valid():
-        form.save()
+    upload = ImageUpload.objects.completed_for(
+        request.user, request.POST.get("upload")
+    )
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        instance=post,
+        upload=upload,
+    )
+    with closing(form):
+        is_valid = form.is_valid()
+        if is_valid:
+            form.save()
+    if is_valid:
+        if upload is not None:
+            upload.discard()
+        if "image" in form.changed_data:
+            schedule_thumbnails(post.image)
         return redirect("posts:post_detail", post.pk)
     context = {
         "form": form,
@@ -118,7 +215,11 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
+            Post.objects.filter(pk=post.pk).update(
+                comment_count=F("comment_count") + 1
+            )
     return redirect("posts:post_detail", post_id=post_id)
 
 
@@ -126,16 +227,42 @@ def add_comment(request, post_id):
 def delete_comment(request, comment_id):
     comment = get_object_or_404(Comment, pk=comment_id)
     post_comment_id = comment.post_id
-    if request.user.username == comment.author.username:
-        comment.delete()
+    if request.user.pk == comment.author_id:
+        with transaction.atomic():
+            comment.delete()
+            Post.objects.filter(
+                pk=post_comment_id, comment_count__gt=0
+            ).update(comment_count=F("comment_count") - 1)
     return redirect("posts:post_detail", post_comment_id)
 
 
+def post_search(request):
+    template = "posts/search.html"
+    query = request.GET.get("q", "").strip()
+    match = build_match(query)
+    page_obj = None
+    if match is not None and is_available():
+        paginator = SearchPaginator(match, settings.PAGE_NUMBER_CONST)
+        page_obj = paginator.get_cursor_page(after=request.GET.get("after"))
+    elif match is not None:
+        post_list = Post.objects.for_feed().filter(text__icontains=query)
+        page_obj = paginator_func(post_list, request)
+    if page_obj is not None:
+        attach_groups(page_obj)
+        attach_likes(page_obj, request.user)
+    context = {"query": query, "page_obj": page_obj}
+    return render(request, template, context)
+
+
 @login_required
 def follow_index(request):
     template = "posts/follow.html"
-    posts = Post.objects.filter(author__following__user=request.user)
-    context = {"page_obj": paginator_func(posts, request)}
+    timeline = request.user.timeline.for_feed()
+    page_obj = paginator_func(timeline, request, key=("pub_date", "post_id"))
+    page_obj.object_list = [entry.post for entry in page_obj]
+    attach_groups(page_obj)
+    attach_likes(page_obj, request.user)
+    context = {"page_obj": page_obj}
     return render(request, template, context)
 
 
@@ -159,11 +286,75 @@ def profile_unfollow(request, username):
 
 
 @login_required
+@require_POST
 def post_like(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    if post.likes.filter(id=request.user.id).exists():
-        post.likes.remove(request.user)
+    post = get_object_or_404(Post.objects.only("like_count"), pk=post_id)
+    state = request.POST.get("liked")
+    if state in ("0", "1"):
+        liked = state == "1"
+        changed = set_like(post.pk, request.user.pk, liked)
     else:
-        post.likes.add(request.user)
-
+        liked, changed = toggle_like(post.pk, request.user.pk)
+    if changed:
+        record_like(post.pk, liked)
+        bump_generations(user_scope(request.user.pk))
+    count = like_count(post)
+    if changed:
+        flush_if_due()
+    if request.is_ajax():
+        return JsonResponse({"liked": liked, "count": count})
     return redirect("posts:post_detail", post_id=post_id)
+
+
+def _upload_state(upload):
+    return {
+        "id": str(upload.pk),
+        "offset": upload.received,
+        "complete": upload.complete,
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Заводит загрузку кусками; в ответе её id и смещение 0."""
+    filename = request.POST.get("filename", "")[:255]
+    try:
+        size = int(request.POST.get("size", ""))
+    except ValueError:
+        size = 0
+    if not filename or not 0 < size <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+        return JsonResponse(
+            {"error": "Нужны имя файла и размер не больше допустимого"},
+            status=400,
+        )
+    upload = ImageUpload.objects.create(
+        user=request.user, filename=filename, size=size
+    )
+    return JsonResponse(_upload_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET", "PUT"])
+def upload_chunk(request, upload_id):
+    """GET — сколько уже принято; PUT ?offset=N — следующий кусок в теле."""
+    upload = get_object_or_404(ImageUpload, pk=upload_id, user=request.user)
+    if request.method == "GET":
+        return JsonResponse(_upload_state(upload))
+    try:
+        offset = int(request.GET["offset"])
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Нужно смещение куска"}, status=400)
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK:
+        return JsonResponse({"error": "Слишком большой кусок"}, status=413)
+    if not 0 <= offset <= upload.received or offset + length > upload.size:
+        # Клиент разошёлся с сервером: пусть продолжит с нашего смещения
+        return JsonResponse(_upload_state(upload), status=409)
+    write_chunk(upload, offset, request, length)
+    if needs_header_check(upload, offset) and not has_image_header(upload):
+        upload.discard()
+        return JsonResponse(
+            {"error": "Загрузите правильное изображение"}, status=400
+        )
+    return JsonResponse(_upload_state(upload))
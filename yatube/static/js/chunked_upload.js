@@ -0,0 +1,84 @@
+// Загружает выбранную картинку кусками и подставляет id загрузки в форму.
+// Оборванную загрузку можно продолжить: сервер сообщает принятое смещение.
+(function () {
+  var CHUNK_SIZE = 1024 * 1024;
+  var MAX_RETRIES = 5;
+
+  function csrfToken(form) {
+    return form.querySelector("[name=csrfmiddlewaretoken]").value;
+  }
+
+  function request(method, url, form, body) {
+    return fetch(url, {
+      method: method,
+      body: body,
+      credentials: "same-origin",
+      headers: {"X-CSRFToken": csrfToken(form)},
+    }).then(function (response) {
+      return response.json().then(function (state) {
+        if (!response.ok && response.status !== 409) {
+          throw new Error(state.error);
+        }
+        return state;
+      });
+    });
+  }
+
+  function sendFrom(form, url, file, state, retries) {
+    if (state.complete) {
+      return Promise.resolve(state);
+    }
+    var chunk = file.slice(state.offset, state.offset + CHUNK_SIZE);
+    return request("PUT", url + "?offset=" + state.offset, form, chunk)
+      .then(function (next) {
+        return sendFrom(form, url, file, next, 0);
+      }, function (error) {
+        if (retries >= MAX_RETRIES) {
+          throw error;
+        }
+        // Обрыв связи: спрашиваем, сколько дошло, и продолжаем оттуда
+        return request("GET", url, form).then(function (next) {
+          return sendFrom(form, url, file, next, retries + 1);
+        });
+      });
+  }
+
+  function upload(form, input) {
+    var file = input.files[0];
+    var data = new FormData();
+    data.append("filename", file.name);
+    data.append("size", file.size);
+    return request("POST", form.dataset.uploadUrl, form, data)
+      .then(function (state) {
+        var url = form.dataset.uploadUrl + state.id + "/";
+        return sendFrom(form, url, file, state, 0);
+      });
+  }
+
+  document.querySelectorAll("form[data-upload-url]").forEach(function (form) {
+    var input = form.querySelector("input[type=file][name=image]");
+    var hidden = form.querySelector("input[name=upload]");
+    var pending = null;
+    input.addEventListener("change", function () {
+      hidden.value = "";
+      if (!input.files.length) {
+        return;
+      }
+      pending = upload(form, input).then(function (state) {
+        hidden.value = state.id;
+        input.value = "";
+      }).catch(function () {
+        // Не вышло по кускам — картинка уйдёт вместе с формой
+        pending = null;
+      });
+    });
+    form.addEventListener("submit", function (event) {
+      if (pending && !hidden.value) {
+        event.preventDefault();
+        pending.then(function () {
+          form.submit();
+        });
+      }
+    });
+  });
+})();
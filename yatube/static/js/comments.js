@@ -0,0 +1,30 @@
+// Подгружает следующую пачку комментариев на место кнопки «Показать ещё».
+// Без JavaScript кнопка ведёт на страницу поста с курсором в адресе.
+(function () {
+  document.addEventListener("click", function (event) {
+    var link = event.target.closest("[data-fragment-url]");
+    if (!link) {
+      return;
+    }
+    event.preventDefault();
+    var more = link.closest("[data-comments-more]");
+    link.classList.add("disabled");
+    fetch(link.dataset.fragmentUrl, {
+      credentials: "same-origin",
+      headers: {"X-Requested-With": "XMLHttpRequest"},
+    })
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.text();
+      })
+      .then(function (html) {
+        more.insertAdjacentHTML("beforebegin", html);
+        more.remove();
+      })
+      .catch(function () {
+        window.location.href = link.href;
+      });
+  });
+})();
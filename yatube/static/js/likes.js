@@ -0,0 +1,49 @@
+// Переключает лайк без перезагрузки страницы. Без JavaScript форма
+// по-прежнему отправляется обычным POST.
+(function () {
+  var LABELS = {"1": "Не нравится", "0": "Нравится"};
+
+  function pluralize(count) {
+    return count + " Like" + (count === 1 ? "" : "s");
+  }
+
+  document.addEventListener("submit", function (event) {
+    var form = event.target;
+    if (!form.hasAttribute("data-like-form")) {
+      return;
+    }
+    event.preventDefault();
+    var button = form.querySelector("[data-liked]");
+    var body = new FormData(form);
+    body.append("liked", button.dataset.liked === "1" ? "0" : "1");
+    button.disabled = true;
+    fetch(form.action, {
+      method: "POST",
+      body: body,
+      credentials: "same-origin",
+      headers: {"X-Requested-With": "XMLHttpRequest"},
+    })
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.json();
+      })
+      .then(function (state) {
+        button.dataset.liked = state.liked ? "1" : "0";
+        button.textContent = LABELS[button.dataset.liked];
+        var counters = document.querySelectorAll(
+          "[data-like-count='" + form.dataset.postId + "']"
+        );
+        counters.forEach(function (counter) {
+          counter.textContent = pluralize(state.count);
+        });
+      })
+      .catch(function () {
+        form.submit();
+      })
+      .finally(function () {
+        button.disabled = false;
+      });
+  });
+})();
@@ -58,6 +58,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.db.middleware.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -88,6 +89,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "yatube.wsgi.application"
 
+# Тесты работают с кэшами в памяти, а не с cache.sqlite3
+TEST_RUNNER = "core.test_runner.TestRunner"
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -99,6 +103,25 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения, алиасы из DATABASES. Локально это копии
+# db.sqlite3, которые обновляет ``manage.py simulate_replication``:
+# DATABASE_REPLICAS=2 поднимает replica1 и replica2
+DATABASE_REPLICAS = []
+for number in range(1, int(os.environ.get("DATABASE_REPLICAS", 0)) + 1):
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, f"db.{alias}.sqlite3"),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.db.routers.ReplicaRouter"]
+
+# Сколько секунд после записи пользователь читает с основной БД;
+# должно быть больше отставания реплик
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -148,14 +171,74 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 PAGE_NUMBER_CONST = 10
+# "cursor" — keyset-пагинация по (pub_date, id), "page" — номера страниц
+PAGINATION_MODE = "cursor"
+# Комментарии под постом подгружаются пачками, новые — первыми
+COMMENTS_PAGE_SIZE = 20
 
 CSRF_FAILURE_VIEW = "core.views.csrf_failure"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Картинки, загружаемые кусками, копятся вне MEDIA_ROOT до отправки формы
+CHUNKED_UPLOAD_ROOT = os.path.join(BASE_DIR, "uploads")
+CHUNKED_UPLOAD_MAX_CHUNK = 4 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
+# Оригиналы картинок ужимаются при загрузке: длинная сторона, качество
+# JPEG/WebP и предел числа пикселей против «бомб» распаковки
+IMAGE_UPLOAD_MAX_SIDE = 2560
+IMAGE_UPLOAD_QUALITY = 85
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 10 ** 6
+
+# SHA-256 загруженного файла считается, пока он приходит
+FILE_UPLOAD_HANDLERS = [
+    "core.uploadhandlers.HashingMemoryFileUploadHandler",
+    "core.uploadhandlers.HashingTemporaryFileUploadHandler",
+]
+
+# Миниатюры постов готовит пул потоков сразу после сохранения картинки.
+# Тесты с временным MEDIA_ROOT включают синхронный режим через
+# override_settings: фоновый поток переживает каталог.
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+# Запасные варианты картинок остаются в формате оригинала, основные — WebP
+THUMBNAIL_PRESERVE_FORMAT = True
+THUMBNAIL_ENGINE = "core.thumbnail_engine.Engine"
+
+# Один файл на узел: все процессы-воркеры видят общий кэш и его сбросы
 CACHES = {
     "default": {
+        "BACKEND": "core.cache.sqlite.SQLiteCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache.sqlite3"),
+        "OPTIONS": {
+            "MAX_ENTRIES": 10000,
+            "MAX_SIZE": 256 * 1024 * 1024,
+        },
+    },
+    # Отложенные счётчики лайков: записи здесь нельзя вытеснять, иначе
+    # изменения пропадут до сброса в БД
+    "likes": {
+        "BACKEND": "core.cache.sqlite.SQLiteCache",
+        "LOCATION": os.path.join(BASE_DIR, "likes.sqlite3"),
+        "OPTIONS": {"MAX_ENTRIES": 0},
+    },
+    # L1 двухуровневого кэша core.cache.tiered, свой у каждого процесса
+    "local": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-    }
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
 }
+
+TIERED_CACHE_L1_TIMEOUT = 5
+
+# Счётчики лайков копятся в кэше и пишутся в БД не чаще раза в интервал
+LIKE_FLUSH_INTERVAL = 10
+LIKE_FLUSH_BATCH = 500
+
+# Как часто процесс сверяет свой каталог групп с общим поколением
+GROUP_CATALOG_CHECK_INTERVAL = 5
+
+# Страницы лент сбрасываются счётчиками поколений, поэтому TTL длинный
+FEED_CACHE_TIMEOUT = 60 * 60